@@ -1,12 +1,11 @@
-import board, busio, time, alarm, gc, wifi, ssl, adafruit_requests, socketpool, microcontroller, analogio
-import waveshare75
+# Only what every wake needs is imported here. The panel driver, sensors, fonts,
+# weather and network stack are imported where first used, so a night wake that
+# finds the panel already blank loads none of them
+import board, time, alarm, gc, microcontroller, analogio
 import adafruit_ds3231
-import adafruit_shtc3
 # import adafruit_veml7700
-from adafruit_datetime import datetime
-import font50
-import font76
-import font100
+from binascii import crc32
+from sleepstate import SleepState
 
 # Get wifi details and more from a secrets.py file
 try:
@@ -17,6 +16,10 @@ except ImportError:
 
 TIME_API = secrets['time_api']
 WEATHER_API = secrets['weather_api']
+# Weather younger than the Cache-Control max-age of its response, or than this
+# (seconds) if the response had none, is drawn from sleep memory without Wi-Fi
+# or any request; the time is then kept by the RTC alone
+WEATHER_MAX_AGE = secrets.get('weather_max_age', 2 * 3600)
 
 days = ("SUN", "MON", "TUE", "WED", "THU", "FRI", "SAT")
 
@@ -34,7 +37,6 @@ mosi = board.MOSI
 i2c = board.I2C()
 rtc_module = adafruit_ds3231.DS3231(i2c)
 # veml7700 = adafruit_veml7700.VEML7700(i2c)
-sht = adafruit_shtc3.SHTC3(i2c)
 
 #### Light sensor ####
 adc = analogio.AnalogIn(board.D5)
@@ -47,6 +49,131 @@ def deep_sleep(low_light=False):
 
     alarm.exit_and_deep_sleep_until_alarms(time_alarm)
 
+def blank_frame_crc():
+    # crc32 of an all-white frame, which is what Clear() leaves on the panel
+    chunk = bytes(1000)
+    crc = 0
+    for i in range(fb_size // 1000):
+        crc = crc32(chunk, crc)
+    return crc & 0xFFFFFFFF
+
+def load_display():
+    # Imports the panel driver and refresh scheduler and allocates the band
+    # buffer, once per wake
+    global waveshare75, refreshsched, band_buf, scheduler
+    if band_buf is not None:
+        return
+    import waveshare75, refreshsched
+    # One band of the previous frame, see scan_frame
+    band_buf = bytearray(waveshare75.BAND_ROWS * (waveshare75.EPD_WIDTH >> 3))
+    # Decides partial vs full refresh on a ghosting budget kept in sleep memory
+    scheduler = refreshsched.RefreshScheduler(refreshsched.RefreshPolicy(), sleep_state)
+
+def panel_state():
+    # (crc32 of the frame on the panel, refreshes, skipped refreshes), kept across deep sleep
+    state = sleep_state.load("frame")
+    if state is None:
+        return (None, 0, 0)
+    return state
+
+def open_last_frame(shown_crc):
+    # The frame on the panel as saved by stream_frame or stream_window, open for
+    # update and checked a band at a time. None if missing or stale
+    try:
+        f = open(LAST_FRAME_PATH, "r+b")
+    except OSError:
+        return None
+    crc = 0
+    size = 0
+    while True:
+        n = f.readinto(band_buf)
+        if not n:
+            break
+        crc = crc32(memoryview(band_buf)[:n], crc)
+        size += n
+    if size != fb_size or crc & 0xFFFFFFFF != shown_crc:
+        f.close()
+        return None
+    f.seek(0)
+    return f
+
+def scan_frame(previous):
+    # Draws the screen band by band (see EPD.render_bands) without sending anything,
+    # so an unchanged frame costs no panel init or transfer. Each band is diffed
+    # against the previous frame, if known.
+    # Returns (crc32 of the frame, DirtyRegion of the changes or None)
+    crc = 0
+    region = None
+    stride = waveshare75.EPD_WIDTH >> 3
+
+    def sink(band, top, rows):
+        nonlocal crc, region
+        crc = crc32(band, crc)
+        if previous:
+            old = memoryview(band_buf)[:len(band)]
+            previous.seek(top * stride)
+            previous.readinto(old)
+            region = epd.diff_region(old, band, top=top, region=region)
+
+    epd.render_bands(buffer_screen, sink)
+    if previous:
+        previous.seek(0)
+    return crc & 0xFFFFFFFF, region
+
+def stream_frame(previous):
+    # Draws the screen again straight into the panel RAM for a fast or full
+    # refresh: the previous frame, if known, goes to DATA_TRANSMISSION_1, then each
+    # band to DATA_TRANSMISSION_2 as soon as it is drawn, and is saved over the
+    # previous frame
+    out = previous
+    if previous:
+        epd.send_command(waveshare75.DATA_TRANSMISSION_1)
+        while True:
+            n = previous.readinto(band_buf)
+            if not n:
+                break
+            epd.send_data_buffer(band_buf, 0, n)
+        previous.seek(0)
+    else:
+        # Needs a boot.py that remounts the filesystem writable. While it is
+        # read-only there is no previous frame and every update is a full refresh
+        try:
+            out = open(LAST_FRAME_PATH, "wb")
+        except OSError:
+            pass
+
+    def sink(band, top, rows):
+        epd.send_data_buffer(band)
+        if out:
+            out.write(band)
+
+    epd.send_command(waveshare75.DATA_TRANSMISSION_2)
+    try:
+        epd.render_bands(buffer_screen, sink)
+    finally:
+        if out:
+            out.close()
+
+def stream_window(previous, window):
+    # Partial refresh of window (byte aligned panel coordinates) through
+    # EPD.display_partial_bands: only the bands overlapping it are drawn again and
+    # only their window bytes sent, the old ones read from the previous frame. The
+    # changes all lie in these bands, so saving them over it is enough
+    stride = waveshare75.EPD_WIDTH >> 3
+
+    def old(band, top, rows):
+        previous.seek(top * stride)
+        previous.readinto(band)
+
+    def save(band, top, rows):
+        previous.seek(top * stride)
+        previous.write(band)
+
+    try:
+        epd.display_partial_bands(buffer_screen, window, old, save, wait=False)
+    finally:
+        previous.close()
+
 def wifi_connect(retries=3):
     i = 0
     print("Connecting to %s"%secrets["ssid"])
@@ -66,12 +193,21 @@ def wifi_connect(retries=3):
 
 # JSON -- Time
 def get_time(retries=3):
+    # Sets the RTC from TIME_API, unless the last response's max-age says the
+    # RTC is still good or the server answers 304 Not Modified
+    if time_http.fresh(time.mktime(rtc_module.datetime)):
+        print("Time still fresh, not fetched")
+        return
     i = 0
     while True:
         try:
             print("Fetching json from", TIME_API)
-            with requests.get(TIME_API) as response:
+            with requests.get(TIME_API, headers=time_http.headers()) as response:
+                if response.status_code == httpcache.NOT_MODIFIED:
+                    time_http.update(response.headers, time.mktime(rtc_module.datetime))
+                    return
                 time_json = response.json()
+                time_headers = response.headers
             break
         except OSError as e:
             print("Failed to get data, retrying\n", e)
@@ -107,20 +243,58 @@ def get_time(retries=3):
     offset_time = time.localtime(time.mktime(set_time) + TIME_OFFSET)
     print("Setting time to:", offset_time)
     rtc_module.datetime = offset_time
+    time_http.update(time_headers, time.mktime(offset_time))
 #     print("Setting time to:", set_time)
 #     rtc_module.datetime = set_time
 
 # JSON -- Weather
-def get_weather(retries=3):
-#     print(rtc_module.datetime.tm_isdst)
-    weather_info = {}
+# Bytes read from the socket at a time
+WEATHER_CHUNK = 512
+
+def stored_weather():
+    # WeatherSnapshot kept in sleep memory by the last fetch, None if there is none
+    state = sleep_state.load("weather")
+    if state is None:
+        return None
+    return weather.WeatherSnapshot.from_bytes(state[0])
+
+def fresh_weather(snapshot):
+    # True if snapshot can be drawn without asking the server: within the max-age
+    # of its response (see WEATHER_MAX_AGE) and from today, as its daily
+    # forecast would otherwise start at yesterday
+    now = rtc_module.datetime
+    if not snapshot or not weather_http.fresh(time.mktime(now), WEATHER_MAX_AGE):
+        return False
+    if time.localtime(snapshot.fetched).tm_mday != now.tm_mday:
+        return False
+    print("Weather from sleep memory, {} s old".format(int(time.mktime(now)) - snapshot.fetched))
+    return True
+
+def get_weather(stored, retries=3):
+    # WeatherSnapshot of the One Call response, streamed (see weather.read_onecall).
+    # The request is conditional when there is a stored snapshot, which is
+    # returned, as of now, if the server answers 304 Not Modified, and as it
+    # is for any other status but 200 (e.g. 401, 429, 5xx), whose body is not
+    # weather. False without either
+    headers = weather_http.headers() if stored else {}
     i = 0
     while True:
         try:
             print("Fetching json from", WEATHER_API)
-            with requests.get(WEATHER_API) as response:
-                weather_json = response.json()
-            break
+            with requests.get(WEATHER_API, headers=headers, stream=True) as response:
+                now = time.mktime(rtc_module.datetime)
+                if stored and response.status_code == httpcache.NOT_MODIFIED:
+                    print("Weather not modified")
+                    stored.fetched = int(now)
+                    snapshot = stored
+                elif response.status_code == 200:
+                    snapshot = weather.read_onecall(response.iter_content(chunk_size=WEATHER_CHUNK), now)
+                else:
+                    # Nothing to cache either: the stored snapshot keeps its age
+                    print("Weather request failed:", response.status_code)
+                    return stored or False
+                weather_http.update(response.headers, now)
+                return snapshot
         except OSError as e:
             print("Failed to get data, retrying\n", e)
             if i < retries:
@@ -133,87 +307,47 @@ def get_weather(retries=3):
             print("No Internet", e)
             return False
 
-    for x in range(24):
-        if rtc_module.datetime.tm_isdst == -1:
-            timestamp = int(weather_json['hourly'][x]['dt']) - 28800
-        else:
-            timestamp = int(weather_json['hourly'][x]['dt']) - 25200
-        datetime_obj = datetime.fromtimestamp(timestamp)
-        if int(datetime_obj.hour) > 9 and int(datetime_obj.hour) < 20:
-            weather_info[datetime_obj.hour] = (datetime_obj.day, weather_json['hourly'][x]['temp'])
-            print(datetime_obj)
-#     print(weather_info)
-    global hour_temp, hour_hum, hour_rain, daily_high, daily_low, daily_pop
-    daily_high = {}
-    daily_low = {}
-    daily_pop = {}
-
-    hour_temp = weather_json['current']['temp']
-#     print(hour_temp)
-    hour_hum = weather_json['current']['humidity']
-#     print(hour_hum)
-    for y in range(7):
-        daily_high[y] = weather_json['daily'][y]['temp']['max']
-        daily_low[y] = weather_json['daily'][y]['temp']['min']
-        daily_pop[y] = weather_json['daily'][y]['pop']
-#     print(daily_high)
-#     print(daily_low)
-    rain_sum = []
-    for i in range(60):
-        try:
-            rain_temp = weather_json['minutely'][i]['precipitation']
-            rain_sum.append(rain_temp)
-        except KeyError:
-            pass
-    if len(rain_sum) > 0:
-        hour_rain = round(sum(rain_sum) / len(rain_sum))
-    else:
-        hour_rain = False
-#     print(hour_rain)
-
-    return weather_info
-
-def buffer_screen():
+def buffer_screen(frame):
 #     Screen Res: 800x480
-    epd.display_string_at(frame_black, 10, 5, "{}".format(wday), font100)
-    epd.display_string_at(frame_black, 250, 5, "{}".format(day), font100)
-    epd.draw_filled_rectangle(frame_black, 0, 103, 800, 108)
-    epd.draw_filled_rectangle(frame_black, 415, 0, 420, 108)
-    epd.display_string_at(frame_black, 450, 10, "{}".format(temp), font76)
-    epd.draw_filled_circle(frame_black, 570, 10, 6)
-    epd.display_string_at(frame_black, 600, 10, "{}%".format(hum), font76)
+    epd.display_string_at(frame, 10, 5, "{}".format(wday), font100)
+    epd.display_string_at(frame, 250, 5, "{}".format(day), font100)
+    epd.draw_filled_rectangle(frame, 0, 103, 800, 108)
+    epd.draw_filled_rectangle(frame, 415, 0, 420, 108)
+    epd.display_string_at(frame, 450, 10, "{}°".format(temp), font76)
+    epd.display_string_at(frame, 600, 10, "{}%".format(hum), font76)
 
     Z = 0
     X_OFFSET = 110
-    if not weather_info:
+    if not forecast:
         pass
     else:
-        epd.display_string_at(frame_black, 150, 130, "{}".format(round(hour_temp)), font76)
-        epd.display_string_at(frame_black, 320, 130, "{}%".format(hour_hum), font76)
+        # Tenths of a degree, rounded here in integer arithmetic
+        epd.display_string_at(frame, 150, 130, "{}".format(weather.whole(forecast.temp)), font76)
+        epd.display_string_at(frame, 320, 130, "{}%".format(forecast.humidity), font76)
 
+        hour_rain = weather.whole(forecast.rain) if forecast.rain != weather.NO_RAIN else 0
         if hour_rain:
-            epd.display_string_at(frame_black, 580, 130, "{}".format(hour_rain), font76)
+            epd.display_string_at(frame, 580, 130, "{}".format(hour_rain), font76)
 
-        epd.draw_filled_rectangle(frame_black, 50, 225, 750, 228)
+        epd.draw_filled_rectangle(frame, 50, 225, 750, 228)
 
         for x in range(7):
-            if round(daily_high[x]) < 100:
-                epd.display_string_at(frame_black, 35 + (X_OFFSET * x), 260, "{}".format(round(daily_high[x])), font50)
-            else:
-                epd.display_string_at(frame_black, 16 + (X_OFFSET * x), 260, "{}".format(round(daily_high[x])), font50)
-            epd.draw_filled_rectangle(frame_black, 30 + (X_OFFSET * x), 325, 115 + (X_OFFSET * x), 335)
-            epd.display_string_at(frame_black, 35 + (X_OFFSET * x), 340, "{}".format(round(daily_low[x])), font50)
-            if daily_pop[x] > 0:
-                pop_temp = int(daily_pop[x] * 100)
+            # Numbers are centred over the day's bar whatever their digit count
+            column = (30 + (X_OFFSET * x), 115 + (X_OFFSET * x))
+            epd.draw_text(frame, 0, 260, "{}".format(weather.whole(forecast.high[x])), font50, align="center", box=column)
+            epd.draw_filled_rectangle(frame, column[0], 325, column[1], 335)
+            epd.draw_text(frame, 0, 340, "{}".format(weather.whole(forecast.low[x])), font50, align="center", box=column)
+            if forecast.pop[x] > 0:
+                pop_temp = forecast.pop[x]
                 if pop_temp < 100:
-                    epd.display_string_at(frame_black, 35 + (X_OFFSET * x), 410, "{}".format(pop_temp), font50)
+                    epd.draw_text(frame, 0, 410, "{}".format(pop_temp), font50, align="center", box=column)
                 else:
-                    epd.display_string_at(frame_black, 55 + (X_OFFSET  * x), 410, "!", font50)
+                    epd.draw_text(frame, 0, 410, "!", font50, align="center", box=column)
 
 
     P_OFFSET = 0
-    for p in range(0, rtc_module.datetime.tm_min // 30):
-        epd.draw_filled_rectangle(frame_black, 50 + P_OFFSET, 470, 60 + P_OFFSET, 480)
+    for p in range(0, t.tm_min // 30):
+        epd.draw_filled_rectangle(frame, 50 + P_OFFSET, 470, 60 + P_OFFSET, 480)
         P_OFFSET += 50
 
 
@@ -226,13 +360,38 @@ TEMP_COMPENSATION = 5
 # Note the wday is off by a day. Account for it in the display code
 TIME_OFFSET = 21
 
+sleep_state = SleepState()
+BLANK_CRC = blank_frame_crc()
+# Previous frame, needed for fast (differential) updates
+LAST_FRAME_PATH = "/last_frame.bin"
+# Set by load_display()
+band_buf = None
+
+# Night wakes are decided on the light sensor alone, before anything is fetched
+light_value = adc.value / 65536 * adc.reference_voltage
+# print("{} / {}".format(adc.value, light_value))
+online = False
+forecast = None
 try:
-    if (wifi_connect()):
-        pool = socketpool.SocketPool(wifi.radio)
-        requests = adafruit_requests.Session(pool, ssl.create_default_context())
-    
-    get_time()
-    weather_info = get_weather()
+    if light_value != 0:
+        import weather, httpcache
+        weather_http = httpcache.HttpCache(sleep_state, "weather_http")
+        time_http = httpcache.HttpCache(sleep_state, "time_http")
+        stored = stored_weather()
+        if fresh_weather(stored):
+            forecast = stored
+    if light_value != 0 and not forecast:
+        # The network stack is only loaded when the weather has to be fetched
+        import wifi, ssl, socketpool, adafruit_requests
+        online = wifi_connect()
+        if online:
+            pool = socketpool.SocketPool(wifi.radio)
+            requests = adafruit_requests.Session(pool, ssl.create_default_context())
+
+        get_time()
+        forecast = get_weather(stored)
+        if forecast:
+            sleep_state.store("weather", forecast.to_bytes())
     # next_update = int(time.monotonic()) + (3600 - (rtc_module.datetime.tm_min * 60))
 except Exception as e:
     print("resetting", e)
@@ -249,10 +408,6 @@ while True:
 #             print("reset microcontroller")
 #             microcontroller.reset()
 
-        epd = waveshare75.EPD(reset, dc, busy, cs, clk, mosi)
-
-        light_value = adc.value / 65536 * adc.reference_voltage
-#         print("{} / {}".format(adc.value, light_value))
         if light_value == 0:
             raise Exception("Not enough light")
 
@@ -260,7 +415,19 @@ while True:
 #         if veml7700.light > 0 and veml7700.light < 20:
 #             raise Exception("Not enough light")
 
-        frame_black = bytearray(fb_size)
+        load_display()
+        # Reused within the session: the except path below gets the same driver
+        epd = waveshare75.EPD.shared(reset, dc, busy, cs, clk, mosi)
+
+        # Glyphs are read from flash as they are drawn (see tools/make_fontpack.py)
+        import fontpack
+        fonts = fontpack.FontPack("/lib/fonts.bin")
+        font50 = fonts["font50"]
+        font76 = fonts["font76"]
+        font100 = fonts["font100"]
+
+        import adafruit_shtc3
+        sht = adafruit_shtc3.SHTC3(i2c)
         temperature, relative_humidity = sht.measurements
         temp = int(((temperature - TEMP_COMPENSATION) * 1.8) + 32)
         hum = int(relative_humidity)
@@ -274,14 +441,51 @@ while True:
         month = t.tm_mon
         day = t.tm_mday
 
-        buffer_screen()
-
-        epd.init()
-        epd.display2(frame_black)
-
-        time.sleep(2)
-        epd.sleep()
-        time.sleep(2)
+        shown_crc, refreshes, skips = panel_state()
+        previous = open_last_frame(shown_crc)
+        new_crc, region = scan_frame(previous)
+        if new_crc == shown_crc:
+            # The panel already shows this frame: no init, transfer or refresh
+            skips += 1
+            if previous:
+                previous.close()
+        else:
+            window = None
+            if previous:
+                window = region.bounds() if region else None
+                changed = region.area() if region else 0
+            else:
+                changed = fb_size * 8
+            region = None
+            now = time.mktime(t)
+            kind = scheduler.decide(changed, now, window is not None, previous is not None)
+
+            epd.init()
+            # The refresh runs in the background while the housekeeping below is done
+            if kind == refreshsched.PARTIAL:
+                stream_window(previous, epd.align_window(*window))
+            else:
+                stream_frame(previous)
+                if kind == refreshsched.FAST:
+                    epd.refresh_ram(waveshare75.MODE_FAST, wait=False)
+                else:
+                    epd.refresh_ram(waveshare75.MODE_FULL, wait=False)
+            if online:
+                wifi.radio.enabled = False
+            scheduler.record(kind, changed, now)
+            print("Refresh: {} ({} px changed)".format(("full", "fast", "partial")[kind], changed))
+            epd.finish_refresh()
+
+            time.sleep(2)
+            epd.sleep()
+            time.sleep(2)
+            refreshes += 1
+            # Refresh latency drifts with temperature and panel age
+            print("Busy: power on {:.2f} s, refresh {:.2f} s, power off {:.2f} s at {:.1f} C".format(
+                epd.busy_times.get(waveshare75.POWER_ON, 0), epd.busy_times.get(waveshare75.DISPLAY_REFRESH, 0),
+                epd.busy_times.get(waveshare75.POWER_OFF, 0), temperature))
+        sleep_state.store("frame", new_crc, refreshes, skips)
+        print("Display: {} refreshed, {} skipped".format(refreshes, skips))
 #         print(60 - int(rtc_module.datetime.tm_sec))
 #         print("{} / {}".format(time.monotonic(), next_update))
 #         time_alarm = alarm.time.TimeAlarm(monotonic_time=time.monotonic() + ((3600 - (rtc_module.datetime.tm_min  * 60)) - int(rtc_module.datetime.tm_sec)))
@@ -290,11 +494,31 @@ while True:
     except Exception as e:
         print(e)
         print("going to sleep")
-        epd.init()
-        epd.Clear()
-        time.sleep(1.5)
-        epd.sleep()
-        time.sleep(2)
+        shown_crc, refreshes, skips = panel_state()
+        if shown_crc == BLANK_CRC:
+            skips += 1
+        else:
+            load_display()
+            # What the panel shows is unknown (crc 0) until Clear() completes, so a
+            # stuck panel gets a full refresh on the next wake
+            shown_crc = 0
+            # A stuck panel would only time out again
+            if not isinstance(e, waveshare75.BusyTimeoutError):
+                try:
+                    # A new driver if sleep() already released the pins; otherwise the
+                    # controller is still configured and init() skips the reset
+                    epd = waveshare75.EPD.shared(reset, dc, busy, cs, clk, mosi)
+                    epd.init()
+                    epd.Clear()
+                    scheduler.record(refreshsched.FULL, 0, time.mktime(rtc_module.datetime))
+                    time.sleep(1.5)
+                    epd.sleep()
+                    time.sleep(2)
+                    refreshes += 1
+                    shown_crc = BLANK_CRC
+                except waveshare75.BusyTimeoutError as busy_error:
+                    print(busy_error)
+        sleep_state.store("frame", shown_crc, refreshes, skips)
         deep_sleep(True)
 #         alarm.light_sleep_until_alarms(time_alarm)
 #         time.sleep(3600 - (rtc_module.datetime.tm_min * 60))
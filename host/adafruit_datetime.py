@@ -0,0 +1,3 @@
+# Host stand-in for adafruit_datetime, which follows the CPython datetime API.
+# Timestamps are UTC like on the board (sim.install() sets TZ)
+from datetime import date, datetime, time, timedelta, timezone, tzinfo  # noqa: F401
@@ -0,0 +1,20 @@
+# Host stand-in for adafruit_ds3231: the RTC reads sim.current.epoch()
+import time
+
+import sim
+
+
+class DS3231:
+    def __init__(self, i2c):
+        self.i2c_device = i2c
+        self.temperature = sim.current.temperature
+        self.lost_power = False
+
+    @property
+    def datetime(self):
+        return time.gmtime(sim.current.epoch())
+
+    @datetime.setter
+    def datetime(self, value):
+        simulator = sim.current
+        simulator.rtc_epoch = time.mktime(value) - int(simulator.clock.now)
@@ -0,0 +1,156 @@
+# Host stand-in for adafruit_requests: HTTP/1.1 over socketpool sockets, one
+# connection per request. Covers what code_7 and the tools use: get/post with
+# headers, status_code, headers, content / text / json() and iter_content()
+import json as _json
+
+
+class OutOfRetries(Exception):
+    pass
+
+
+class Response:
+    def __init__(self, sock, method):
+        self.socket = sock
+        self._pending = b""
+        self._cached = None
+        line = self._readline()
+        parts = line.split(b" ", 2)
+        self.status_code = int(parts[1])
+        self.reason = parts[2] if len(parts) > 2 else b""
+        self.headers = {}
+        while True:
+            line = self._readline()
+            if not line:
+                break
+            name, _, value = line.partition(b":")
+            self.headers[name.strip().decode().lower()] = value.strip().decode()
+        self._chunked = self.headers.get("transfer-encoding", "").lower() == "chunked"
+        self._chunk_left = 0
+        self._remaining = None      # None: until the server closes
+        if method == "HEAD" or self.status_code in (204, 304) or 100 <= self.status_code < 200:
+            self._remaining = 0
+        elif not self._chunked and "content-length" in self.headers:
+            self._remaining = int(self.headers["content-length"])
+
+    def _fill(self):
+        data = self.socket.recv(1024)
+        self._pending += data
+        return len(data)
+
+    def _readline(self):
+        while b"\r\n" not in self._pending:
+            if not self._fill():
+                line, self._pending = self._pending, b""
+                return line
+        line, _, self._pending = self._pending.partition(b"\r\n")
+        return line
+
+    def _take(self, size):
+        # Up to size body bytes of the current framing, b"" at the end
+        while not self._pending:
+            if not self._fill():
+                return b""
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    def _read(self, size):
+        if self._chunked:
+            if self._chunk_left == 0:
+                self._chunk_left = int(self._readline().split(b";")[0] or b"0", 16)
+                if self._chunk_left == 0:
+                    while self._readline():     # trailer
+                        pass
+                    self._chunked = False
+                    self._remaining = 0
+                    return b""
+            data = self._take(min(size, self._chunk_left))
+            self._chunk_left -= len(data)
+            if self._chunk_left == 0:
+                self._readline()
+            return data
+        if self._remaining is None:
+            return self._take(size)
+        if self._remaining == 0:
+            return b""
+        data = self._take(min(size, self._remaining))
+        self._remaining -= len(data)
+        return data
+
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        while True:
+            data = self._read(chunk_size)
+            if not data:
+                break
+            yield data.decode() if decode_unicode else data
+        self.close()
+
+    @property
+    def content(self):
+        if self._cached is None:
+            self._cached = b"".join(self.iter_content(1024))
+        return self._cached
+
+    @property
+    def text(self):
+        return self.content.decode()
+
+    def json(self):
+        return _json.loads(self.content)
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Session:
+    def __init__(self, socket_pool, ssl_context=None):
+        self._pool = socket_pool
+        self._ssl_context = ssl_context
+
+    def request(self, method, url, data=None, json=None, headers=None, stream=False, timeout=60):
+        proto, _, rest = url.partition("://")
+        host, _, path = rest.partition("/")
+        port = 443 if proto == "https" else 80
+        if ":" in host:
+            host, port = host.split(":")
+            port = int(port)
+        if json is not None:
+            data = _json.dumps(json)
+        if isinstance(data, str):
+            data = data.encode()
+
+        address = self._pool.getaddrinfo(host, port, 0, self._pool.SOCK_STREAM)[0][-1]
+        sock = self._pool.socket(self._pool.AF_INET, self._pool.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(address)
+        if proto == "https":
+            sock._sock = self._ssl_context.wrap_socket(sock._sock, server_hostname=host)
+
+        lines = ["{} /{} HTTP/1.1".format(method, path), "Host: {}".format(host),
+                 "User-Agent: Adafruit CircuitPython", "Connection: close"]
+        for name, value in (headers or {}).items():
+            lines.append("{}: {}".format(name, value))
+        if data is not None:
+            lines.append("Content-Length: {}".format(len(data)))
+        sock.sendall(("\r\n".join(lines) + "\r\n\r\n").encode() + (data or b""))
+
+        response = Response(sock, method)
+        if not stream:
+            response.content
+        return response
+
+    def get(self, url, **kw):
+        return self.request("GET", url, **kw)
+
+    def post(self, url, **kw):
+        return self.request("POST", url, **kw)
+
+    def head(self, url, **kw):
+        return self.request("HEAD", url, **kw)
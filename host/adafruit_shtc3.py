@@ -0,0 +1,21 @@
+# Host stand-in for adafruit_shtc3: readings come from sim.current
+import sim
+
+
+class SHTC3:
+    def __init__(self, i2c):
+        self.i2c_device = i2c
+        self.sleeping = False
+        self.low_power = False
+
+    @property
+    def measurements(self):
+        return (sim.current.temperature, sim.current.humidity)
+
+    @property
+    def temperature(self):
+        return sim.current.temperature
+
+    @property
+    def relative_humidity(self):
+        return sim.current.humidity
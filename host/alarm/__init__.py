@@ -0,0 +1,36 @@
+# Host stand-in for alarm. Deep sleep moves the clock to the earliest alarm and
+# raises sim.DeepSleep, which host/run.py turns into the next wake
+import sim
+
+from . import pin, time
+
+sleep_memory = sim.current.sleep_memory
+wake_alarm = sim.current.wake_alarm
+
+
+def _earliest(alarms):
+    # (monotonic time it fires, alarm) of the first alarm to fire
+    best = None
+    for a in alarms:
+        when = a._fires_at(sim.current)
+        if when is not None and (best is None or when < best[0]):
+            best = (when, a)
+    if best is None:
+        raise ValueError("no alarm can ever fire")
+    return best
+
+
+def light_sleep_until_alarms(*alarms):
+    global wake_alarm
+    when, fired = _earliest(alarms)
+    sim.current.sleep_until(when)
+    wake_alarm = sim.current.wake_alarm = fired
+    return fired
+
+
+def exit_and_deep_sleep_until_alarms(*alarms, preserve_dios=()):
+    when, fired = _earliest(alarms)
+    sim.current.stats["asleep"] = sim.current.clock.now
+    sim.current.sleep_until(when)
+    sim.current.wake_alarm = fired
+    raise sim.DeepSleep(fired)
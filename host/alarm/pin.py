@@ -0,0 +1,23 @@
+# Host stand-in for alarm.pin. Only the panel's BUSY line changes by itself,
+# so that is the one pin an alarm can wait for
+import sim
+
+
+class PinAlarm:
+    def __init__(self, pin, value, edge=False, pull=False):
+        self.pin = pin
+        self.value = value
+        self.edge = edge
+        self.pull = pull
+
+    def _fires_at(self, simulator):
+        if self.pin.name == sim.EPD_PINS["busy"]:
+            busy_now = simulator.panel.busy
+            if (busy_now == sim.BUSY_ACTIVE) == bool(self.value):
+                return None if self.edge else simulator.clock.now
+            if bool(self.value) == sim.BUSY_ACTIVE:
+                return None     # waiting for busy to start, it never does by itself
+            return simulator.busy_release_time()
+        if simulator.levels.get(self.pin.name, False) == bool(self.value) and not self.edge:
+            return simulator.clock.now
+        return None
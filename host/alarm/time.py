@@ -0,0 +1,14 @@
+# Host stand-in for alarm.time
+import sim
+
+
+class TimeAlarm:
+    def __init__(self, monotonic_time=None, epoch_time=None):
+        if (monotonic_time is None) == (epoch_time is None):
+            raise ValueError("Supply monotonic_time or epoch_time")
+        if epoch_time is not None:
+            monotonic_time = epoch_time - sim.current.rtc_epoch
+        self.monotonic_time = monotonic_time
+
+    def _fires_at(self, simulator):
+        return self.monotonic_time
@@ -0,0 +1,16 @@
+# Host stand-in for analogio; values come from sim.current.analog
+import sim
+
+
+class AnalogIn:
+    reference_voltage = 3.3
+
+    def __init__(self, pin):
+        self._name = pin.name
+
+    @property
+    def value(self):
+        return sim.current.analog_value(self._name)
+
+    def deinit(self):
+        pass
@@ -0,0 +1,31 @@
+# Host stand-in for CircuitPython's board module (Unexpected Maker TinyS3 pin names)
+import busio
+
+
+class Pin:
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return "board." + self.name
+
+
+for _name in ("D0", "D1", "D2", "D3", "D4", "D5", "D6", "D7", "D8", "D9", "D21", "D34", "D35",
+              "D36", "D37", "D43", "D44", "A0", "A1", "A2", "A3", "A4", "A5", "A6", "A7", "A8",
+              "A9", "SDA", "SCL", "SCK", "MOSI", "MISO", "TX", "RX", "LED", "NEOPIXEL",
+              "NEOPIXEL_POWER", "VBAT_SENSE", "VBUS_SENSE", "LDO2", "AMB"):
+    globals()[_name] = Pin(_name)
+
+
+_i2c = None
+
+
+def I2C():
+    global _i2c
+    if _i2c is None:
+        _i2c = busio.I2C(SCL, SDA)
+    return _i2c
+
+
+def SPI():
+    return busio.SPI(SCK, MOSI, MISO)
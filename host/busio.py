@@ -0,0 +1,62 @@
+# Host stand-in for busio. SPI writes go to the panel in sim; I2C only carries
+# the lock protocol, the device drivers code_7 uses are stood in directly
+import sim
+
+
+class SPI:
+    def __init__(self, clock, MOSI=None, MISO=None, half_duplex=False):
+        self._locked = False
+        self.frequency = sim.current.baudrate
+
+    def try_lock(self):
+        if self._locked:
+            return False
+        self._locked = True
+        return True
+
+    def unlock(self):
+        self._locked = False
+
+    def configure(self, baudrate=100000, polarity=0, phase=0, bits=8):
+        sim.current.baudrate = baudrate
+        self.frequency = baudrate
+
+    def write(self, buffer, start=0, end=None):
+        if end is None:
+            end = len(buffer)
+        sim.current.spi_write(memoryview(buffer)[start:end])
+
+    def readinto(self, buffer, start=0, end=None, write_value=0):
+        if end is None:
+            end = len(buffer)
+        for i in range(start, end):
+            buffer[i] = 0
+
+    def deinit(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.deinit()
+
+
+class I2C:
+    def __init__(self, scl, sda, frequency=100000, timeout=255):
+        self._locked = False
+
+    def try_lock(self):
+        if self._locked:
+            return False
+        self._locked = True
+        return True
+
+    def unlock(self):
+        self._locked = False
+
+    def scan(self):
+        return [0x68, 0x70]     # DS3231, SHTC3
+
+    def deinit(self):
+        pass
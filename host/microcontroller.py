@@ -0,0 +1,20 @@
+# Host stand-in for microcontroller
+import sim
+
+
+class _Processor:
+    frequency = 240000000
+    temperature = 35.0
+    voltage = 3.3
+
+
+cpu = _Processor()
+nvm = bytearray(8192)
+
+
+def reset():
+    raise sim.Reset()
+
+
+def on_next_reset(run_mode):
+    pass
@@ -0,0 +1,158 @@
+# Runs a CircuitPython script on the host simulator for a number of wakes.
+#
+#   python host/run.py [--wakes 4] [--frames out/] [--writable] "code_7 - ....py"
+#
+# Every wake starts the script from scratch, like the board after deep sleep:
+# modules loaded by the previous wake are dropped, while sleep memory, the
+# panel and the clock carry over. After each wake one line reports the virtual
+# time awake, the latency to the first SPI byte, SPI and GPIO traffic and the
+# refreshes the panel did; --frames saves what the panel shows as PNG. Wakes
+# that never imported wifi, socketpool or adafruit_requests are marked offline.
+#
+# Without a secrets.py on the drive, one pointing at an unreachable host is
+# used, so network fetches fail fast the way they do without Wi-Fi. --serve
+# starts the local stand-in APIs (host/standin.py) and points the secrets at
+# them instead; each wake then also reports the requests, how many were
+# answered 304 Not Modified, and the bytes served.
+
+import argparse
+import calendar
+import os
+import runpy
+import sys
+import time
+import traceback
+import types
+
+HOST = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HOST)
+
+import sim  # noqa: E402
+import standin  # noqa: E402
+import uc8179  # noqa: E402
+
+SECRETS = {
+    "ssid": "simulated",
+    "password": "simulated",
+    "time_api": "http://127.0.0.1:9/time",
+    "weather_api": "http://127.0.0.1:9/weather",
+}
+
+# Imported by every wake that uses the network
+NETWORK_MODULES = ("wifi", "socketpool", "adafruit_requests")
+
+
+def parse_time(text):
+    return calendar.timegm(time.strptime(text, "%Y-%m-%d %H:%M"))
+
+
+def dark_hours(spec):
+    # "22-6" -> analog source reading 0 (no light) from 22:00 to 06:00
+    start, end = (int(h) for h in spec.split("-"))
+
+    def light(simulator):
+        hour = time.gmtime(simulator.epoch()).tm_hour
+        dark = start <= hour or hour < end if start > end else start <= hour < end
+        return 0 if dark else 30000
+    return light
+
+
+def run_wake(script, root, baseline, secrets=None):
+    # One boot of the board: returns the exception that ended it, None when the
+    # script ran to the end. secrets replaces the drive's secrets.py
+    for name in list(sys.modules):
+        if name not in baseline:
+            del sys.modules[name]
+    if secrets is not None or not os.path.exists(os.path.join(root, "secrets.py")):
+        module = types.ModuleType("secrets")
+        module.secrets = dict(secrets or SECRETS)
+        sys.modules["secrets"] = module
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except (sim.DeepSleep, sim.Reset) as e:
+        return e
+    except Exception as e:
+        traceback.print_exc()
+        return e
+    return None
+
+
+def report(simulator, wake, refreshes_before, server=None, served_before=(0, 0)):
+    stats = simulator.stats
+    awake = (stats["asleep"] if stats["asleep"] is not None else simulator.clock.now) - stats["start"]
+    first = stats["first_spi"]
+    first = "{:7.1f} ms".format((first - stats["start"]) * 1000) if first is not None else "      -   "
+    refreshes = simulator.panel.refreshes[refreshes_before:]
+    kinds = ",".join("{}:{:.2f}s".format(r[1], r[3]) for r in refreshes) or "-"
+    line = ("wake {:3d} {}  awake {:7.2f} s  first SPI {}  SPI {:6d} B / {:5d} writes  GPIO {:6d}  "
+            "net {:6d} B  refresh {}".format(
+                wake, time.strftime("%Y-%m-%d %H:%M", time.gmtime(stats["epoch"])), awake, first,
+                stats["spi_bytes"], stats["spi_writes"], stats["gpio"],
+                stats["net_rx"] + stats["net_tx"], kinds))
+    if server:
+        requests = server.requests[served_before[0]:]
+        line += "  served {} req ({} 304) / {} B".format(
+            len(requests), sum(1 for _, status in requests if status == 304),
+            server.bytes_served - served_before[1])
+    if not any(name in sys.modules for name in NETWORK_MODULES):
+        line += "  offline"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a CircuitPython script on the host simulator")
+    parser.add_argument("script")
+    parser.add_argument("--root", help="directory standing in for CIRCUITPY (default: the script's)")
+    parser.add_argument("--wakes", type=int, default=1)
+    parser.add_argument("--start", default="2024-02-09 07:00", help="RTC time at power on, UTC")
+    parser.add_argument("--dark", help="hours without light, e.g. 22-6")
+    parser.add_argument("--writable", action="store_true", help="let the script write to the drive")
+    parser.add_argument("--frames", help="directory for a PNG of the panel after each wake")
+    parser.add_argument("--serve", action="store_true", help="serve the time and weather APIs locally")
+    parser.add_argument("--weather", default=standin.FIXTURE, help="One Call response --serve sends")
+    parser.add_argument("--weather-max-age", type=int, help="Cache-Control max-age of the weather, s")
+    parser.add_argument("--time-max-age", type=int, help="Cache-Control max-age of the time, s")
+    parser.add_argument("--weather-every", type=int,
+                        help="wakes after which the served weather is modified (default: never)")
+    args = parser.parse_args()
+
+    script = os.path.abspath(args.script)
+    root = os.path.abspath(args.root or os.path.dirname(script))
+    simulator = sim.start(root=root, writable=args.writable, epoch=parse_time(args.start))
+    if args.dark:
+        simulator.analog["D5"] = dark_hours(args.dark)
+    server = None
+    secrets = None
+    if args.serve:
+        server = standin.StandIn(simulator, args.weather, args.weather_max_age, args.time_max_age).start()
+        secrets = dict(SECRETS, time_api=server.url("time"), weather_api=server.url("weather"))
+    simulator.install()
+    sys.path[1:1] = [os.path.join(root, "lib"), root]
+    if args.frames:
+        os.makedirs(args.frames, exist_ok=True)
+
+    baseline = set(sys.modules)
+    for wake in range(args.wakes):
+        if wake:
+            simulator.new_wake()
+        simulator.wakes += 1
+        before = len(simulator.panel.refreshes)
+        errors = len(simulator.panel.errors)
+        if server and args.weather_every and wake and wake % args.weather_every == 0:
+            server.touch()
+        served = (len(server.requests), server.bytes_served) if server else (0, 0)
+        ended = run_wake(script, root, baseline, secrets)
+        report(simulator, wake, before, server, served)
+        for when, message in simulator.panel.errors[errors:]:
+            print("    panel: {} at {:.3f} s".format(message, when))
+        if args.frames:
+            simulator.panel.save(os.path.join(args.frames, "wake{:03d}.png".format(wake)))
+        if not isinstance(ended, (sim.DeepSleep, sim.Reset)):
+            break
+    simulator.uninstall()
+    if server:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
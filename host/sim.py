@@ -0,0 +1,303 @@
+# Shared state of the host simulator. The stand-in CircuitPython modules in
+# this directory (board, busio, digitalio, alarm, analogio, wifi, socketpool,
+# microcontroller and the few Adafruit drivers code_7 uses) all talk to the
+# Simulator in `current`: a virtual clock, pin levels, the UC8179 on the SPI
+# bus, sleep memory, sensor values and the CIRCUITPY drive.
+#
+# Time is virtual. install() points time.sleep / time.monotonic at the clock,
+# so driver delays cost nothing on the host, and every SPI write, GPIO access
+# and busy period advances it by the TIMING model below. Run scripts with
+# host/run.py, or from Python:
+#
+#   import sim
+#   sim.start(root="/path/to/CIRCUITPY").install()
+
+import builtins
+import io
+import os
+import time
+
+import uc8179
+
+# Timing model, seconds. The per-call costs are CircuitPython call overhead on
+# an ESP32-S3 (estimates); the rest are UC8179 figures.
+TIMING = {
+    "spi_call": 25e-6,      # per spi.write(), plus the bytes at the configured baudrate
+    "gpio_call": 8e-6,      # per DigitalInOut.value read or write
+    "reset_busy": 1e-3,     # controller busy after its reset line is released
+    "power_on": 0.12,
+    "power_off": 0.03,
+    "frame_rate": 50,       # LUT frames per second
+    "otp_refresh": 4.0,     # refresh time with the waveform from OTP
+    "wifi_connect": 2.0,
+    "boot": 0.6,            # reset to the first line of code.py
+}
+
+# How the panel is wired in code_7
+EPD_PINS = {"reset": "D1", "dc": "D3", "busy": "D2", "cs": "D4"}
+
+# BUSY level while the controller works, as waveshare75.ReadBusy expects
+BUSY_ACTIVE = True
+
+
+class DeepSleep(BaseException):
+    # Raised by alarm.exit_and_deep_sleep_until_alarms; ends the wake. Not an
+    # Exception so the script's own handlers do not swallow it
+    def __init__(self, alarm):
+        super().__init__(alarm)
+        self.alarm = alarm
+
+
+class Reset(BaseException):
+    # Raised by microcontroller.reset()
+    pass
+
+
+class SleepMemory:
+    # alarm.sleep_memory as CircuitPython has it: len(), and int or slice
+    # indexing and assignment, but no buffer protocol, so struct.unpack_from,
+    # memoryview and the like fail here as they do on the board
+    def __init__(self, size):
+        self._bytes = bytearray(size)
+
+    def __len__(self):
+        return len(self._bytes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return bytes(self._bytes[index])
+        if isinstance(index, int):
+            return self._bytes[index]
+        raise TypeError("sleep memory indices must be integers or slices")
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            if len(range(*index.indices(len(self._bytes)))) != len(value):
+                raise ValueError("slice and value lengths differ")    # no resizing
+            self._bytes[index] = value
+        elif isinstance(index, int):
+            self._bytes[index] = value
+        else:
+            raise TypeError("sleep memory indices must be integers or slices")
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def advance(self, seconds):
+        if seconds > 0:
+            self.now += seconds
+
+    def monotonic(self):
+        return self.now
+
+    def monotonic_ns(self):
+        return int(self.now * 1e9)
+
+
+class Simulator:
+    def __init__(self, root=None, writable=False, epoch=1700000000, timing=None):
+        self.clock = Clock()
+        self.timing = dict(TIMING)
+        if timing:
+            self.timing.update(timing)
+        self.panel = uc8179.UC8179(self.clock, self.timing)
+        self.levels = {}                # pin name -> output level
+        self.baudrate = 100000          # busio.SPI default until configure()
+        self.sleep_memory = SleepMemory(4096)
+        self.rtc_epoch = epoch          # RTC time when the clock read 0
+        self.temperature = 22.0         # SHTC3, degrees C
+        self.humidity = 45.0
+        self.analog = {"D5": 30000}     # pin name -> 16 bit value, or callable(sim)
+        self.wifi_available = True
+        self.wifi_connected = False
+        self.root = root                # CIRCUITPY drive, None to leave open() alone
+        self.writable = writable
+        self.files = {}                 # files written by the script, path -> bytes
+        self.wakes = 0
+        self.wake_alarm = None
+        self._saved = None
+        self.new_wake()
+
+    # Clock and stats
+
+    def charge(self, seconds):
+        self.clock.advance(seconds)
+
+    def epoch(self):
+        return int(self.rtc_epoch + self.clock.now)
+
+    def new_wake(self):
+        # Called at every (re)boot: resets per-wake counters and the radio
+        self.stats = {
+            "start": self.clock.now,
+            "asleep": None,         # clock when deep sleep began
+            "first_spi": None,      # clock when the first SPI byte went out
+            "spi_bytes": 0,
+            "spi_writes": 0,
+            "gpio": 0,
+            "net_tx": 0,
+            "net_rx": 0,
+        }
+        self.wifi_connected = False
+        self.charge(self.timing["boot"])
+        self.stats["epoch"] = self.epoch()
+
+    # Pins
+
+    def set_pin(self, name, value):
+        self.charge(self.timing["gpio_call"])
+        self.stats["gpio"] += 1
+        value = bool(value)
+        previous = self.levels.get(name)
+        self.levels[name] = value
+        if name == EPD_PINS["reset"] and value and previous is False:
+            self.panel.hard_reset()
+
+    def get_pin(self, name):
+        self.charge(self.timing["gpio_call"])
+        self.stats["gpio"] += 1
+        if name == EPD_PINS["busy"]:
+            return self.panel.busy == BUSY_ACTIVE
+        return self.levels.get(name, False)
+
+    def analog_value(self, name):
+        value = self.analog.get(name, 0)
+        return value(self) if callable(value) else value
+
+    # SPI
+
+    def spi_write(self, data):
+        n = len(data)
+        self.charge(self.timing["spi_call"] + n * 8 / self.baudrate)
+        if self.stats["first_spi"] is None:
+            self.stats["first_spi"] = self.clock.now
+        self.stats["spi_bytes"] += n
+        self.stats["spi_writes"] += 1
+        if self.levels.get(EPD_PINS["cs"], True):
+            return  # panel not selected
+        if self.levels.get(EPD_PINS["dc"], False):
+            self.panel.write_data(data)
+        else:
+            for command in bytes(data):
+                self.panel.write_command(command)
+
+    # Sleep
+
+    def sleep_until(self, monotonic_time):
+        self.clock.now = max(self.clock.now, monotonic_time)
+
+    def busy_release_time(self):
+        return self.panel.busy_until
+
+    # CIRCUITPY drive
+
+    def drive_path(self, path):
+        # Host path of an absolute CIRCUITPY path, None if it is not on the drive
+        if self.root is None or not isinstance(path, str) or not path.startswith("/"):
+            return None
+        return os.path.join(self.root, path.lstrip("/"))
+
+    def open(self, path, mode="r", *args, **kwargs):
+        host_path = self.drive_path(path)
+        if host_path is None:
+            return self._saved["open"](path, mode, *args, **kwargs)
+        if any(c in mode for c in "wax+"):
+            if not self.writable:
+                raise OSError(30, "Read-only filesystem")  # EROFS, as on the device
+            return _DriveFile(self, path, mode)
+        if path in self.files:
+            data = self.files[path]
+            return io.BytesIO(data) if "b" in mode else io.StringIO(data.decode())
+        if not os.path.exists(host_path):
+            host_path = path    # not on the drive, e.g. linecache reading sources
+        return self._saved["open"](host_path, mode, *args, **kwargs)
+
+    # Patching
+
+    def install(self):
+        # Points time and open() at the simulator. TZ is UTC like CircuitPython's
+        # time module, so mktime/localtime agree with the board
+        global current
+        current = self
+        if self._saved is None:
+            self._saved = {"sleep": time.sleep, "monotonic": time.monotonic,
+                           "monotonic_ns": time.monotonic_ns, "open": builtins.open}
+        time.sleep = self.clock.advance
+        time.monotonic = self.clock.monotonic
+        time.monotonic_ns = self.clock.monotonic_ns
+        builtins.open = self.open
+        os.environ["TZ"] = "UTC"
+        time.tzset()
+        return self
+
+    def uninstall(self):
+        if self._saved is not None:
+            time.sleep = self._saved["sleep"]
+            time.monotonic = self._saved["monotonic"]
+            time.monotonic_ns = self._saved["monotonic_ns"]
+            builtins.open = self._saved["open"]
+            self._saved = None
+
+
+class _DriveFile:
+    # Writable file on the simulated drive; kept in memory so runs do not touch
+    # the checkout
+    def __init__(self, sim, path, mode):
+        self._sim = sim
+        self._path = path
+        self._buf = io.BytesIO()
+        if "w" not in mode:     # "a", "r+": start from the current contents
+            data = sim.files.get(path)
+            if data is None:
+                host_path = sim.drive_path(path)
+                if os.path.exists(host_path):
+                    with sim._saved["open"](host_path, "rb") as f:
+                        data = f.read()
+                elif "r" in mode:
+                    raise OSError(2, "No such file/directory")  # ENOENT
+            self._buf.write(data or b"")
+            if "a" not in mode:
+                self._buf.seek(0)
+        self._text = "b" not in mode
+
+    def write(self, data):
+        if self._text:
+            data = data.encode()
+        return self._buf.write(data)
+
+    def read(self, size=-1):
+        data = self._buf.read(size)
+        return data.decode() if self._text else data
+
+    def readinto(self, buf):
+        return self._buf.readinto(buf)
+
+    def seek(self, offset, whence=0):
+        return self._buf.seek(offset, whence)
+
+    def tell(self):
+        return self._buf.tell()
+
+    def close(self):
+        self._sim.files[self._path] = self._buf.getvalue()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def start(**kwargs):
+    # Replaces the current simulator with a fresh one
+    global current
+    if current is not None:
+        current.uninstall()
+    current = Simulator(**kwargs)
+    return current
+
+
+current = None
+current = Simulator()
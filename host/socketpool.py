@@ -0,0 +1,72 @@
+# Host stand-in for socketpool, backed by host sockets. Traffic is counted in
+# sim.current.stats (net_tx / net_rx) and needs a wifi connection
+import socket as _socket
+
+import sim
+
+
+class Socket:
+    def __init__(self, sock):
+        self._sock = sock
+
+    def connect(self, address):
+        self._sock.connect(address)
+
+    def settimeout(self, value):
+        self._sock.settimeout(value)
+
+    def setsockopt(self, level, optname, value):
+        self._sock.setsockopt(level, optname, value)
+
+    def send(self, data):
+        n = self._sock.send(data)
+        sim.current.stats["net_tx"] += n
+        return n
+
+    def sendall(self, data):
+        self._sock.sendall(data)
+        sim.current.stats["net_tx"] += len(data)
+
+    def recv_into(self, buffer, bufsize=0):
+        n = self._sock.recv_into(buffer, bufsize)
+        sim.current.stats["net_rx"] += n
+        return n
+
+    def recv(self, bufsize):
+        data = self._sock.recv(bufsize)
+        sim.current.stats["net_rx"] += len(data)
+        return data
+
+    def close(self):
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SocketPool:
+    AF_INET = _socket.AF_INET
+    SOCK_STREAM = _socket.SOCK_STREAM
+    SOCK_DGRAM = _socket.SOCK_DGRAM
+    IPPROTO_TCP = _socket.IPPROTO_TCP
+    SOL_SOCKET = _socket.SOL_SOCKET
+    SO_REUSEADDR = _socket.SO_REUSEADDR
+    gaierror = _socket.gaierror
+
+    def __init__(self, radio):
+        self._radio = radio
+
+    def _check(self):
+        if not sim.current.wifi_connected:
+            raise OSError(113, "No route to host")   # EHOSTUNREACH
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        self._check()
+        return _socket.getaddrinfo(host, port, family, type, proto, flags)
+
+    def socket(self, family=_socket.AF_INET, type=_socket.SOCK_STREAM, proto=0):
+        self._check()
+        return Socket(_socket.socket(family, type, proto))
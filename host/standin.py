@@ -0,0 +1,136 @@
+# Local stand-in for the time and weather APIs, for host/run.py --serve. An
+# HTTP server on 127.0.0.1, in a background thread, answers
+#
+#   /time     the simulator's RTC time, in the fields get_time reads
+#   /weather  a One Call fixture (host/fixtures/onecall.json by default), with
+#             an ETag and Last-Modified, and 304 Not Modified to a request
+#             whose If-None-Match or If-Modified-Since still matches
+#
+# and counts the requests it got, their status and the bytes it served,
+# headers included. Either answer carries Cache-Control: max-age when one is
+# given for it. set_weather() changes the weather served, touch() only its
+# validators, as a server that regenerated the same response would.
+import email.utils
+import json
+import os
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "onecall.json")
+
+
+class _CountingWriter:
+    def __init__(self, stream, server):
+        self._stream = stream
+        self._server = server
+
+    def write(self, data):
+        self._server.bytes_served += len(data)
+        return self._stream.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.wfile = _CountingWriter(self.wfile, self.server)
+
+    def do_GET(self):
+        standin = self.server.standin
+        if self.path == "/time":
+            self.answer(200, standin.time_body(), standin.time_max_age)
+        elif self.path == "/weather":
+            headers = {"ETag": standin.etag,
+                       "Last-Modified": email.utils.formatdate(standin.modified, usegmt=True)}
+            if standin.not_modified(self.headers):
+                self.answer(304, b"", standin.weather_max_age, headers)
+            else:
+                self.answer(200, standin.weather, standin.weather_max_age, headers)
+        else:
+            self.send_error(404)
+            standin.requests.append((self.path, 404))
+
+    def answer(self, status, body, max_age, headers=None):
+        self.server.standin.requests.append((self.path, status))
+        self.send_response(status)
+        if status == 200:
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+        if max_age is not None:
+            self.send_header("Cache-Control", "max-age={}".format(max_age))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandIn:
+    def __init__(self, simulator, weather_path=FIXTURE, weather_max_age=None, time_max_age=None):
+        self.simulator = simulator
+        self.weather_max_age = weather_max_age
+        self.time_max_age = time_max_age
+        self.requests = []          # (path, status), in order
+        self.revision = 0
+        with open(weather_path, "rb") as f:
+            self.set_weather(f.read())
+        self._server = None
+        self._thread = None
+
+    @property
+    def bytes_served(self):
+        return self._server.bytes_served if self._server else 0
+
+    def set_weather(self, body):
+        # Serves body from now on, last modified at the simulator's current time
+        self.weather = body
+        self.touch()
+
+    def touch(self):
+        self.revision += 1
+        self.etag = '"{:08x}-{}"'.format(zlib.crc32(self.weather), self.revision)
+        self.modified = self.simulator.epoch()
+
+    def not_modified(self, headers):
+        # True if the request's validators match the weather served. If-None-Match
+        # takes precedence over If-Modified-Since, as in RFC 9110
+        tags = headers.get("If-None-Match")
+        if tags is not None:
+            return tags.strip() == "*" or self.etag in (t.strip() for t in tags.split(","))
+        since = headers.get("If-Modified-Since")
+        if since is None:
+            return False
+        try:
+            return self.modified <= email.utils.parsedate_to_datetime(since).timestamp()
+        except (TypeError, ValueError):
+            return False
+
+    def time_body(self):
+        t = time.gmtime(self.simulator.epoch())
+        return json.dumps({"year": t.tm_year, "mon": t.tm_mon, "mday": t.tm_mday,
+                           "hour": t.tm_hour, "min": t.tm_min, "sec": t.tm_sec,
+                           "wday": (t.tm_wday + 1) % 7, "isdst": 0}).encode()
+
+    def start(self):
+        self._server = HTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.standin = self
+        self._server.bytes_served = 0
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def url(self, path):
+        return "http://127.0.0.1:{}/{}".format(self._server.server_address[1], path)
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,296 @@
+# Virtual UC8179 controller (Waveshare 7.5" V2 panel) for the host simulator.
+#
+# Decodes the command / data stream the driver sends, keeps both RAM planes
+# (DATA_TRANSMISSION_1 "old" and DATA_TRANSMISSION_2 "new") and the image the
+# panel actually shows, and holds BUSY for as long as the real controller
+# would so the clock in sim charges the driver's busy waits. Bit 1 is black in
+# both planes, the same layout as the driver's frame buffers.
+
+import io
+import struct
+import zlib
+
+WIDTH = 800
+HEIGHT = 480
+
+PANEL_SETTING = 0x00
+POWER_SETTING = 0x01
+POWER_OFF = 0x02
+POWER_ON = 0x04
+BOOSTER_SOFT_START = 0x06
+DEEP_SLEEP = 0x07
+DATA_TRANSMISSION_1 = 0x10
+DISPLAY_REFRESH = 0x12
+DATA_TRANSMISSION_2 = 0x13
+DUAL_SPI_MODE = 0x15
+LUT_VCOM = 0x20
+LUT_WW = 0x21
+LUT_BW = 0x22
+LUT_WB = 0x23
+LUT_BB = 0x24
+PLL_CONTROL = 0x30
+VCOM_DATA_INTERVAL = 0x50
+TCON_SETTING = 0x60
+RESOLUTION_SETTING = 0x61
+GATE_SOURCE_START_SETTING = 0x65
+GET_STATUS = 0x71
+VCOM_DC = 0x82
+PARTIAL_WINDOW = 0x90
+PARTIAL_IN = 0x91
+PARTIAL_OUT = 0x92
+
+COMMAND_NAMES = {
+    PANEL_SETTING: "PANEL_SETTING",
+    POWER_SETTING: "POWER_SETTING",
+    POWER_OFF: "POWER_OFF",
+    POWER_ON: "POWER_ON",
+    BOOSTER_SOFT_START: "BOOSTER_SOFT_START",
+    DEEP_SLEEP: "DEEP_SLEEP",
+    DATA_TRANSMISSION_1: "DATA_TRANSMISSION_1",
+    DISPLAY_REFRESH: "DISPLAY_REFRESH",
+    DATA_TRANSMISSION_2: "DATA_TRANSMISSION_2",
+    DUAL_SPI_MODE: "DUAL_SPI_MODE",
+    LUT_VCOM: "LUT_VCOM",
+    LUT_WW: "LUT_WW",
+    LUT_BW: "LUT_BW",
+    LUT_WB: "LUT_WB",
+    LUT_BB: "LUT_BB",
+    PLL_CONTROL: "PLL_CONTROL",
+    VCOM_DATA_INTERVAL: "VCOM_DATA_INTERVAL",
+    TCON_SETTING: "TCON_SETTING",
+    RESOLUTION_SETTING: "RESOLUTION_SETTING",
+    GATE_SOURCE_START_SETTING: "GATE_SOURCE_START_SETTING",
+    GET_STATUS: "GET_STATUS",
+    VCOM_DC: "VCOM_DC",
+    PARTIAL_WINDOW: "PARTIAL_WINDOW",
+    PARTIAL_IN: "PARTIAL_IN",
+    PARTIAL_OUT: "PARTIAL_OUT",
+}
+
+# Refresh kinds in UC8179.refreshes
+FULL = "full"           # every pixel driven
+DIFFERENTIAL = "diff"   # only pixels whose old and new bits differ
+
+
+def command_name(command):
+    return COMMAND_NAMES.get(command, "0x{:02X}".format(command))
+
+
+def lut_frames(lut):
+    # Frames one LUT runs for: groups of (level select, 4 phase lengths, repeat)
+    frames = 0
+    for i in range(0, len(lut) - 5, 6):
+        frames += sum(lut[i + 1:i + 5]) * lut[i + 5]
+    return frames
+
+
+def lut_drives(lut):
+    # True if any phase of the LUT puts a voltage on the pixel
+    return any(lut[i] for i in range(0, len(lut) - 5, 6) if sum(lut[i + 1:i + 5]) * lut[i + 5])
+
+
+def _popcount(value):
+    return bin(value).count("1")
+
+
+# Exports use io.open, which sim leaves alone when it redirects open() to the
+# simulated drive
+
+def write_pbm(path, frame, width=WIDTH, height=HEIGHT):
+    # Raw PBM stores 1 = black, MSB first, which is the frame layout as is
+    with io.open(path, "wb") as f:
+        f.write("P4\n{} {}\n".format(width, height).encode())
+        f.write(frame)
+
+
+def write_png(path, frame, width=WIDTH, height=HEIGHT):
+    # 1 bit greyscale PNG, where 0 is black, so the frame is inverted
+    stride = (width + 7) >> 3
+    rows = bytearray()
+    for y in range(height):
+        rows.append(0)  # filter: none
+        rows.extend(b ^ 0xFF for b in frame[y * stride:(y + 1) * stride])
+
+    def chunk(kind, body):
+        return (struct.pack(">I", len(body)) + kind + body +
+                struct.pack(">I", zlib.crc32(kind + body) & 0xFFFFFFFF))
+
+    with io.open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 1, 0, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(bytes(rows), 9)))
+        f.write(chunk(b"IEND", b""))
+
+
+class UC8179:
+    # clock: anything with a `now` attribute in seconds. timing: dict with
+    # reset_busy, power_on, power_off, frame_rate and otp_refresh, see sim.TIMING
+
+    def __init__(self, clock, timing):
+        self.clock = clock
+        self.timing = timing
+        self.width = WIDTH
+        self.height = HEIGHT
+        size = WIDTH * HEIGHT >> 3
+        self.old = bytearray(size)
+        self.new = bytearray(size)
+        self.shown = bytearray(size)    # what the panel displays
+        self.refreshes = []             # (time, kind, window, seconds, pixels driven)
+        self.errors = []                # protocol misuse, e.g. commands while busy
+        self.stats = {}                 # command -> [times sent, data bytes]
+        self.hard_reset()
+
+    def hard_reset(self):
+        self.registers = {}
+        self.command = None
+        self.powered = False
+        self.asleep = False
+        self.partial = False
+        self.window = (0, 0, WIDTH - 1, HEIGHT - 1)
+        self._pos = 0
+        self.busy_until = self.clock.now + self.timing["reset_busy"]
+
+    @property
+    def busy(self):
+        return self.clock.now < self.busy_until
+
+    def _error(self, message):
+        self.errors.append((self.clock.now, message))
+
+    def _busy_for(self, seconds):
+        self.busy_until = self.clock.now + seconds
+
+    # SPI side
+
+    def write_command(self, command):
+        if self.asleep:
+            self._error("{} while in deep sleep".format(command_name(command)))
+            return
+        if self.busy and command != GET_STATUS:
+            self._error("{} while busy".format(command_name(command)))
+        self.command = command
+        self.registers[command] = b""
+        self._pos = 0
+        self.stats.setdefault(command, [0, 0])[0] += 1
+        if command == POWER_ON:
+            self.powered = True
+            self._busy_for(self.timing["power_on"])
+        elif command == POWER_OFF:
+            self.powered = False
+            self._busy_for(self.timing["power_off"])
+        elif command == PARTIAL_IN:
+            self.partial = True
+        elif command == PARTIAL_OUT:
+            self.partial = False
+        elif command == DISPLAY_REFRESH:
+            self._refresh()
+
+    def write_data(self, data):
+        if self.asleep or self.command is None:
+            if not self.asleep:
+                self._error("data without a command")
+            return
+        self.stats[self.command][1] += len(data)
+        if self.command in (DATA_TRANSMISSION_1, DATA_TRANSMISSION_2):
+            self._write_ram(self.old if self.command == DATA_TRANSMISSION_1 else self.new, data)
+            return
+        value = self.registers[self.command] + bytes(data)
+        self.registers[self.command] = value
+        if self.command == DEEP_SLEEP and value[:1] == b"\xa5":
+            self.asleep = True
+            # RAM is not retained, garbage shows up if a driver relies on it
+            for plane in (self.old, self.new):
+                plane[:] = b"\xaa" * len(plane)
+        elif self.command == PARTIAL_WINDOW and len(value) >= 8:
+            x0 = (value[0] << 8 | value[1]) & ~0x7
+            x1 = (value[2] << 8 | value[3]) | 0x7
+            y0 = value[4] << 8 | value[5]
+            y1 = value[6] << 8 | value[7]
+            self.window = (x0, y0, min(x1, WIDTH - 1), min(y1, HEIGHT - 1))
+        elif self.command == RESOLUTION_SETTING and len(value) >= 4:
+            self.width = value[0] << 8 | value[1]
+            self.height = value[2] << 8 | value[3]
+
+    def _area(self):
+        # RAM / refresh window: the partial window in partial mode, else the panel
+        if self.partial:
+            return self.window
+        return (0, 0, WIDTH - 1, HEIGHT - 1)
+
+    def _write_ram(self, plane, data):
+        # Data fills the window row by row from where the last write stopped
+        x0, y0, x1, y1 = self._area()
+        stride = WIDTH >> 3
+        row_bytes = (x1 >> 3) - (x0 >> 3) + 1
+        limit = row_bytes * (y1 - y0 + 1)
+        data = memoryview(data)
+        i = 0
+        while i < len(data) and self._pos < limit:
+            row, col = divmod(self._pos, row_bytes)
+            n = min(row_bytes - col, len(data) - i)
+            addr = (y0 + row) * stride + (x0 >> 3) + col
+            plane[addr:addr + n] = data[i:i + n]
+            i += n
+            self._pos += n
+        if i < len(data):
+            self._error("{} bytes past the end of RAM".format(len(data) - i))
+
+    # Refresh model
+
+    def _luts(self):
+        # Register LUTs when PANEL_SETTING selects them (REG bit), else None (OTP)
+        setting = self.registers.get(PANEL_SETTING, b"")
+        if not setting or not setting[0] & 0x20:
+            return None
+        luts = [self.registers.get(r, b"") for r in (LUT_VCOM, LUT_WW, LUT_BW, LUT_WB, LUT_BB)]
+        return luts if all(luts) else None
+
+    def refresh_time(self):
+        luts = self._luts()
+        if luts is None:
+            return self.timing["otp_refresh"]
+        return max(lut_frames(lut) for lut in luts) / self.timing["frame_rate"]
+
+    def _refresh(self):
+        if not self.powered:
+            self._error("DISPLAY_REFRESH while powered off")
+            return
+        luts = self._luts()
+        keep_white = luts is not None and not lut_drives(luts[1])
+        keep_black = luts is not None and not lut_drives(luts[4])
+        x0, y0, x1, y1 = self._area()
+        stride = WIDTH >> 3
+        c0 = x0 >> 3
+        c1 = (x1 >> 3) + 1
+        full = (1 << ((c1 - c0) * 8)) - 1
+        driven_total = 0
+        for y in range(y0, y1 + 1):
+            a = y * stride + c0
+            b = y * stride + c1
+            old = int.from_bytes(self.old[a:b], "big")
+            new = int.from_bytes(self.new[a:b], "big")
+            shown = int.from_bytes(self.shown[a:b], "big")
+            driven = full
+            if keep_white:
+                driven &= ~(~old & ~new & full)
+            if keep_black:
+                driven &= ~(old & new)
+            driven_total += _popcount(driven & full)
+            shown = (shown & ~driven) | (new & driven)
+            self.shown[a:b] = (shown & full).to_bytes(c1 - c0, "big")
+        interval = self.registers.get(VCOM_DATA_INTERVAL, b"")
+        if interval and interval[0] & 0x08:    # N2OCP: new data becomes old data
+            for y in range(y0, y1 + 1):
+                a = y * stride + c0
+                self.old[a:a + c1 - c0] = self.new[a:a + c1 - c0]
+        seconds = self.refresh_time()
+        kind = DIFFERENTIAL if keep_white or keep_black else FULL
+        self.refreshes.append((self.clock.now, kind, (x0, y0, x1, y1), seconds, driven_total))
+        self._busy_for(seconds)
+
+    def save(self, path):
+        # Exports what the panel shows, PNG or PBM by extension
+        if path.lower().endswith(".png"):
+            write_png(path, self.shown)
+        else:
+            write_pbm(path, self.shown)
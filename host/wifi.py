@@ -0,0 +1,28 @@
+# Host stand-in for wifi. Connecting costs TIMING["wifi_connect"] on the clock
+# and fails with ConnectionError when sim.current.wifi_available is False
+import sim
+
+
+class _Radio:
+    enabled = True
+    hostname = "tinys3"
+
+    def connect(self, ssid, password=None, channel=0, bssid=None, timeout=None):
+        sim.current.charge(sim.current.timing["wifi_connect"])
+        if not sim.current.wifi_available:
+            raise ConnectionError("No network with that ssid")
+        sim.current.wifi_connected = True
+
+    @property
+    def connected(self):
+        return sim.current.wifi_connected
+
+    @property
+    def ipv4_address(self):
+        return "192.168.4.2" if sim.current.wifi_connected else None
+
+    def stop_station(self):
+        sim.current.wifi_connected = False
+
+
+radio = _Radio()
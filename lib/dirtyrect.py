@@ -0,0 +1,79 @@
+# Default number of rectangles kept before neighbours are merged
+DEFAULT_MAX_RECTS = 8
+
+
+def _union(a, b):
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def _area(r):
+    return (r[2] - r[0] + 1) * (r[3] - r[1] + 1)
+
+
+class DirtyRegion:
+    # Panel area touched since the last clear(), as a short list of inclusive
+    # (x0, y0, x1, y1) rectangles. Rectangles that overlap or touch are merged as
+    # they come in; past max_rects the pair whose union adds the least area is
+    # merged, so the list stays bounded however many primitives are drawn.
+
+    def __init__(self, max_rects=DEFAULT_MAX_RECTS):
+        self.max_rects = max_rects
+        self.rects = []
+
+    def __len__(self):
+        return len(self.rects)
+
+    def add(self, x0, y0, x1, y1):
+        for r in self.rects:
+            if r[0] <= x0 and r[1] <= y0 and x1 <= r[2] and y1 <= r[3]:
+                return  # already covered, the common case for pixels and glyphs
+        self._insert((x0, y0, x1, y1))
+        while len(self.rects) > self.max_rects:
+            self._merge_cheapest()
+
+    def _insert(self, rect):
+        # Absorbs every rectangle that overlaps or touches rect, then appends it
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(self.rects)):
+                r = self.rects[i]
+                if (rect[0] <= r[2] + 1 and r[0] <= rect[2] + 1 and
+                        rect[1] <= r[3] + 1 and r[1] <= rect[3] + 1):
+                    rect = _union(rect, self.rects.pop(i))
+                    merged = True
+                    break
+        self.rects.append(rect)
+
+    def _merge_cheapest(self):
+        best = None
+        for i in range(len(self.rects)):
+            for j in range(i + 1, len(self.rects)):
+                a = self.rects[i]
+                b = self.rects[j]
+                grow = _area(_union(a, b)) - _area(a) - _area(b)
+                if best is None or grow < best[0]:
+                    best = (grow, i, j)
+        _, i, j = best
+        b = self.rects.pop(j)
+        a = self.rects.pop(i)
+        self._insert(_union(a, b))
+
+    def bounds(self):
+        # Single rectangle covering everything, None when clean
+        if not self.rects:
+            return None
+        rect = self.rects[0]
+        for r in self.rects[1:]:
+            rect = _union(rect, r)
+        return rect
+
+    def area(self):
+        # Pixels covered by the rectangles (they never overlap)
+        total = 0
+        for r in self.rects:
+            total += _area(r)
+        return total
+
+    def clear(self):
+        self.rects = []
@@ -0,0 +1,205 @@
+import struct
+from collections import OrderedDict
+
+# Font pack layout (little endian), written by tools/make_fontpack.py
+#
+#   header      4s magic "EPFP", B version, B font count, H reserved
+#   font entry  16s name, H width, H height, H glyph count, H reserved,
+#               I glyph index offset, I glyph data offset
+#   glyph index H codepoint, H first/last inked row, B first/last inked byte
+#               column per glyph, in the same order as the glyph data.
+#               Blank glyphs store BLANK as their first row.
+#   glyph data  glyph count * glyph_bytes, same bitmap layout as font*.py
+#
+# Glyphs are read from flash only when drawn, so the RAM cost of a font is
+# its glyph index plus whatever sits in the glyph cache.
+
+MAGIC = b'EPFP'
+VERSION = 2
+HEADER = '<4sBBH'
+FONT_ENTRY = '<16sHHHHII'
+GLYPH_ENTRY = '<HHHBB'
+BLANK = 0xFFFF
+
+# RAM budget for raw glyphs kept per pack, in bytes. On top of the pre-shifted
+# glyphcache.GlyphCache: a font211 glyph alone is ~3.7 KB, a font100 one ~1.1 KB
+DEFAULT_CACHE_BUDGET = 8 * 1024
+
+
+def ink_box(data, offset, row_bytes, height):
+    # (first row, last row, first byte column, last byte column) holding set
+    # pixels in the glyph at data[offset:], or None for a blank glyph
+    top = None
+    bottom = 0
+    left = row_bytes
+    right = -1
+    for r in range(height):
+        base = offset + r * row_bytes
+        for k in range(row_bytes):
+            if data[base + k]:
+                if top is None:
+                    top = r
+                bottom = r
+                if k < left:
+                    left = k
+                if k > right:
+                    right = k
+    if top is None:
+        return None
+    return (top, bottom, left, right)
+
+
+class Font:
+    # Bitmap font with its metrics worked out once. offsets maps codepoint to the
+    # byte offset of that glyph in data, so the charset need not be contiguous;
+    # boxes maps codepoint to ink_box() and is filled on first use unless given,
+    # extents likewise caches ink_extent().
+    __slots__ = ('name', 'width', 'height', 'row_bytes', 'glyph_bytes', 'data', 'offsets', 'boxes',
+                 'extents')
+
+    def __init__(self, name, width, height, data, offsets, boxes=None):
+        self.name = name
+        self.width = width
+        self.height = height
+        self.row_bytes = (width >> 3) + (1 if width & 0x7 else 0)
+        self.glyph_bytes = self.row_bytes * height
+        self.data = data
+        self.offsets = offsets
+        self.boxes = {} if boxes is None else boxes
+        self.extents = {}
+
+    @classmethod
+    def from_module(cls, module):
+        # font*.py modules hold a contiguous run of glyphs starting at space
+        row_bytes = (module.width >> 3) + (1 if module.width & 0x7 else 0)
+        glyph_bytes = row_bytes * module.height
+        offsets = {}
+        for i in range(len(module.data) // glyph_bytes):
+            offsets[0x20 + i] = i * glyph_bytes
+        return cls(module.__name__, module.width, module.height, module.data, offsets)
+
+    def __contains__(self, char):
+        return ord(char) in self.offsets
+
+    def locate(self, char):
+        # (buffer, offset) of the bitmap for char, (None, 0) if the font lacks it
+        offset = self.offsets.get(ord(char))
+        if offset is None:
+            return None, 0
+        return self.data, offset
+
+    def ink_box(self, char):
+        # ink_box() of char, None if blank or missing
+        codepoint = ord(char)
+        try:
+            return self.boxes[codepoint]
+        except KeyError:
+            pass
+        data, offset = self.locate(char)
+        box = None if data is None else ink_box(data, offset, self.row_bytes, self.height)
+        self.boxes[codepoint] = box
+        return box
+
+    def ink_extent(self, char):
+        # (first, last + 1) inked pixel column of char, None if blank or missing.
+        # Pixel exact, unlike the byte columns of the ink box
+        codepoint = ord(char)
+        try:
+            return self.extents[codepoint]
+        except KeyError:
+            pass
+        box = self.ink_box(char)
+        extent = None
+        if box is not None:
+            top, bottom, left, right = box
+            data, offset = self.locate(char)
+            left_bits = 0
+            right_bits = 0
+            for j in range(top, bottom + 1):
+                row = offset + j * self.row_bytes
+                left_bits |= data[row + left]
+                right_bits |= data[row + right]
+            first = 0
+            while not left_bits & (0x80 >> first):
+                first += 1
+            last = 7
+            while not right_bits & (0x80 >> last):
+                last -= 1
+            extent = ((left << 3) + first, (right << 3) + last + 1)
+        self.extents[codepoint] = extent
+        return extent
+
+
+class PackedFont(Font):
+    # Font whose offsets point into the pack file; glyphs are read on demand
+    __slots__ = ('pack',)
+
+    def __init__(self, pack, name, width, height, index, data_offset):
+        offsets = {}
+        boxes = {}
+        glyph_bytes = ((width >> 3) + (1 if width & 0x7 else 0)) * height
+        for i, (codepoint, top, bottom, left, right) in enumerate(index):
+            offsets[codepoint] = data_offset + i * glyph_bytes
+            boxes[codepoint] = None if top == BLANK else (top, bottom, left, right)
+        super().__init__(name, width, height, None, offsets, boxes)
+        self.pack = pack
+
+    def locate(self, char):
+        offset = self.offsets.get(ord(char))
+        if offset is None:
+            return None, 0
+        return self.pack.read_glyph(self, char, offset), 0
+
+    def ink_box(self, char):
+        return self.boxes.get(ord(char))
+
+
+class FontPack:
+    def __init__(self, path, cache_budget=DEFAULT_CACHE_BUDGET):
+        self._file = open(path, 'rb')
+        self.cache_budget = cache_budget
+        self.cache_used = 0
+        self.reads = 0
+        self._cache = OrderedDict()
+        self.fonts = {}
+
+        magic, version, count, _ = struct.unpack(HEADER, self._file.read(struct.calcsize(HEADER)))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('not a font pack: {}'.format(path))
+        entries = []
+        for _ in range(count):
+            entries.append(struct.unpack(FONT_ENTRY, self._file.read(struct.calcsize(FONT_ENTRY))))
+        entry_size = struct.calcsize(GLYPH_ENTRY)
+        for name, width, height, glyphs, _, index_offset, data_offset in entries:
+            name = name.rstrip(b'\x00').decode()
+            self._file.seek(index_offset)
+            table = self._file.read(entry_size * glyphs)
+            index = [struct.unpack_from(GLYPH_ENTRY, table, i * entry_size) for i in range(glyphs)]
+            self.fonts[name] = PackedFont(self, name, width, height, index, data_offset)
+
+    def __getitem__(self, name):
+        return self.fonts[name]
+
+    def read_glyph(self, font, char, offset):
+        # The glyph's bitmap, from the LRU cache or read from flash. Glyphs larger
+        # than the whole budget are read every time rather than cached
+        key = (font.name, char)
+        glyph = self._cache.pop(key, None)
+        if glyph is None:
+            glyph = bytearray(font.glyph_bytes)
+            self._file.seek(offset)
+            self._file.readinto(glyph)
+            self.reads += 1
+            size = len(glyph)
+            if size > self.cache_budget:
+                return glyph
+            while self.cache_used + size > self.cache_budget:
+                self.cache_used -= len(self._cache.pop(next(iter(self._cache))))
+            self.cache_used += size
+        self._cache[key] = glyph
+        return glyph
+
+    def close(self):
+        self._file.close()
+        self._cache = OrderedDict()
+        self.cache_used = 0
@@ -0,0 +1,86 @@
+from collections import OrderedDict
+
+# Default RAM budget for cached glyphs, in bytes. A font211 glyph is ~3.9 KB
+# once shifted, the glyphs of one buffer_screen frame need about 15 KB.
+DEFAULT_BUDGET = 16 * 1024
+
+
+def preshift(src, start, width, height, shift, stride=None):
+    # Returns the bitmap at src[start:] re-packed so that its first pixel sits at
+    # bit `shift` of the first byte. Each row grows to (shift + width + 7) >> 3
+    # bytes and padding bits past `width` are cleared, so the result can be ORed
+    # straight into a frame buffer row at byte column x >> 3. stride is the
+    # source row length, when only part of a glyph is taken.
+    row_bytes = (width >> 3) + (1 if width & 0x7 else 0)
+    if stride is None:
+        stride = row_bytes
+    out_bytes = (shift + width + 7) >> 3
+    pad_mask = (0xFF << (row_bytes * 8 - width)) & 0xFF
+    spill = 8 - shift
+    out = bytearray(out_bytes * height)
+    for r in range(height):
+        src_row = start + r * stride
+        out_row = r * out_bytes
+        for k in range(row_bytes):
+            b = src[src_row + k]
+            if k == row_bytes - 1:
+                b &= pad_mask
+            if not b:
+                continue
+            out[out_row + k] |= b >> shift
+            if shift and k + 1 < out_bytes:
+                out[out_row + k + 1] |= (b << spill) & 0xFF
+    return out
+
+
+class GlyphCache:
+    # LRU cache of pre-shifted glyphs keyed by (font, char, x & 7).
+    # hits / misses / evictions are cumulative; compare used against
+    # gc.mem_free() on the board to pick a budget.
+
+    def __init__(self, budget=DEFAULT_BUDGET):
+        self.budget = budget
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def get(self, font, char, shift):
+        key = (font, char, shift)
+        glyph = self._entries.pop(key, None)
+        if glyph is None:
+            self.misses += 1
+            return None
+        self._entries[key] = glyph   # re-insert as most recently used
+        self.hits += 1
+        return glyph
+
+    def put(self, font, char, shift, glyph):
+        size = len(glyph)
+        if size > self.budget:
+            return
+        key = (font, char, shift)
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.used -= len(old)
+        while self.used + size > self.budget:
+            oldest = next(iter(self._entries))
+            self.used -= len(self._entries.pop(oldest))
+            self.evictions += 1
+        self._entries[key] = glyph
+        self.used += size
+
+    def clear(self):
+        self._entries = OrderedDict()
+        self.used = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "used": self.used,
+            "budget": self.budget,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
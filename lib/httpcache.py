@@ -0,0 +1,90 @@
+# HTTP caching for a resource fetched at most once per wake. What the last
+# response said about caching is kept in a SleepState region (see
+# sleepstate.REGIONS), so it survives deep sleep:
+#
+#   stored          epoch seconds of the last 200 or 304
+#   max_age         its Cache-Control max-age, NO_MAX_AGE without one
+#   etag, modified  its ETag and Last-Modified, sent back as If-None-Match and
+#                   If-Modified-Since. Values whose UTF-8 encoding is longer
+#                   than their field are not kept, rather than cut short
+#
+# The payload itself is kept by the caller (e.g. as a WeatherSnapshot): this
+# only decides whether a request is needed at all and makes it conditional, and
+# the caller reuses its payload when the answer is NOT_MODIFIED.
+
+NOT_MODIFIED = 304
+NO_MAX_AGE = 0xFFFFFFFF
+ETAG_SIZE = 48
+MODIFIED_SIZE = 29      # "Fri, 09 Feb 2024 07:00:00 GMT"
+
+
+def _fits(value, size):
+    # value if its encoding fits a size byte field, else "" (no validator)
+    return value if len(value.encode()) <= size else ""
+
+
+def max_age(cache_control):
+    # Seconds from a Cache-Control header value; 0 with no-cache or no-store,
+    # None without a max-age
+    seconds = None
+    for directive in cache_control.split(","):
+        directive = directive.strip().lower()
+        if directive in ("no-cache", "no-store"):
+            return 0
+        if directive.startswith("max-age="):
+            try:
+                seconds = max(0, int(directive[8:].strip('"')))
+            except ValueError:
+                pass
+    return seconds
+
+
+class HttpCache:
+    def __init__(self, state, name):
+        self.state = state
+        self.name = name
+        values = state.load(name)
+        self.known = values is not None     # False until the first response
+        if values is None:
+            values = (0, NO_MAX_AGE, b"", b"")
+        self.stored, self.max_age = values[0], values[1]
+        self.etag = values[2].rstrip(b"\x00").decode()
+        self.modified = values[3].rstrip(b"\x00").decode()
+
+    def fresh(self, now, default_max_age=0):
+        # True while the last response can be reused without asking: within
+        # its max-age, or default_max_age if it gave none
+        age = now - self.stored
+        if not self.known or age < 0:
+            return False
+        limit = default_max_age if self.max_age == NO_MAX_AGE else self.max_age
+        return age < limit
+
+    def headers(self, headers=None):
+        # headers (a new dict if None) plus the conditional request headers
+        if headers is None:
+            headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.modified:
+            headers["If-Modified-Since"] = self.modified
+        return headers
+
+    def update(self, response_headers, now):
+        # Records a 200 or 304 received at now. A 304 keeps the validators it
+        # does not repeat
+        cache_control = response_headers.get("cache-control")
+        seconds = max_age(cache_control) if cache_control else None
+        self.max_age = NO_MAX_AGE if seconds is None else seconds
+        etag = response_headers.get("etag")
+        modified = response_headers.get("last-modified")
+        if etag is not None:
+            self.etag = _fits(etag, ETAG_SIZE)
+        if modified is not None:
+            self.modified = _fits(modified, MODIFIED_SIZE)
+        if cache_control and "no-store" in cache_control.lower():
+            self.etag = self.modified = ""
+        self.stored = int(now)
+        self.known = True
+        self.state.store(self.name, self.stored, self.max_age, self.etag.encode(),
+                         self.modified.encode())
@@ -0,0 +1,258 @@
+import json
+
+# Streaming JSON extraction: picks the values at a few paths out of a document
+# fed in chunks (e.g. response.iter_content), without building the document.
+# Memory stays bounded whatever its size: one stack entry per open container on
+# a wanted path and one token of at most TOKEN_LIMIT bytes. Everything else is
+# skipped as it streams past.
+#
+# A path is a tuple of object keys (str) and array limits (int n: elements
+# 0..n-1), e.g. ("daily", 7, "temp", "max"). Wanted values must be strings,
+# numbers, true, false or null; containers at a path are skipped.
+
+TOKEN_LIMIT = 64
+
+# Parser modes
+_VALUE = 0          # a value is next
+_FIRST = 1          # after "[": a value or "]"
+_KEY = 2            # after "{" or ",": a key, or "}" right after "{"
+_COLON = 3
+_AFTER = 4          # after a value: "," or the container's end
+_STRING = 5         # inside a string
+_SCALAR = 6         # inside a number, true, false or null
+_SKIP = 7           # inside a container nobody wants
+_END = 8            # after the top level value
+
+_QUOTE = 0x22
+
+
+def _space(c):
+    # MicroPython's bytes do not support "int in bytes"
+    return c == 0x20 or c == 0x0A or c == 0x0D or c == 0x09
+
+
+class JsonExtractor:
+    # paths: {path: name}. on_value(name, indices, value) is called for every value
+    # found at one of them, indices being the array indices along its path
+    def __init__(self, paths, on_value, token_limit=TOKEN_LIMIT):
+        self.paths = paths
+        self.on_value = on_value
+        self.token_limit = token_limit
+        # Keys as bytes, as they are compared with the raw document
+        self._paths = {}
+        for path, name in paths.items():
+            self._paths[tuple(p.encode() if isinstance(p, str) else p for p in path)] = name
+        self._stack = []            # [in array, key or index, candidate paths] per container
+        self._mode = _VALUE
+        self._token = bytearray()
+        self._overflow = False      # token longer than token_limit, matches nothing
+        self._target = None         # name of the wanted value being read
+        self._is_key = False        # the string being read is an object key
+        self._escape = False        # a chunk ended right after a backslash
+        self._skip_depth = 0
+        self._skip_string = False
+
+    def _candidates(self):
+        # Paths the value starting now lies on, and the name if it ends there
+        if not self._stack:
+            return list(self._paths), None
+        in_array, at, parent = self._stack[-1]
+        depth = len(self._stack) - 1
+        found = []
+        name = None
+        for path in parent:
+            step = path[depth]
+            if in_array:
+                on_path = isinstance(step, int) and at < step
+            else:
+                on_path = step == at
+            if on_path:
+                found.append(path)
+                if len(path) == depth + 1:
+                    name = self._paths[path]
+        return found, name
+
+    def _begin(self, c):
+        # First byte c of a value
+        paths, name = self._candidates()
+        if c == 0x7B or c == 0x5B:      # { [
+            depth = len(self._stack)
+            paths = [p for p in paths if len(p) > depth]
+            if paths:
+                self._stack.append([c == 0x5B, 0 if c == 0x5B else None, paths])
+                self._mode = _FIRST if c == 0x5B else _KEY
+            else:
+                self._mode = _SKIP
+                self._skip_depth = 1
+                self._skip_string = False
+            return
+        self._target = name
+        self._token[:] = b''
+        self._overflow = False
+        if c == _QUOTE:
+            self._is_key = False
+            self._mode = _STRING
+        else:
+            self._token.append(c)
+            self._mode = _SCALAR
+
+    def _collect(self, data):
+        if self._overflow:
+            return
+        if len(self._token) + len(data) > self.token_limit:
+            self._overflow = True
+        else:
+            self._token.extend(data)
+
+    def _end_value(self):
+        # A string or scalar value is complete
+        if self._target is not None and not self._overflow:
+            token = bytes(self._token)
+            if self._mode == _STRING:
+                token = b'"' + token + b'"'
+            try:
+                value = json.loads(token)
+            except ValueError:
+                raise ValueError('bad JSON value {}'.format(token))
+            self.on_value(self._target, tuple(e[1] for e in self._stack if e[0]), value)
+        self._target = None
+        self._mode = _AFTER if self._stack else _END
+
+    def _close(self, c):
+        # } or ], ending the innermost open container
+        if not self._stack or self._stack[-1][0] != (c == 0x5D):
+            raise ValueError('unexpected {}'.format(chr(c)))
+        self._stack.pop()
+        self._mode = _AFTER if self._stack else _END
+
+    def _string_end(self, chunk, i, n):
+        # Index of the closing quote of the string starting at chunk[i], n if it
+        # runs past the chunk. Escapes are skipped, not decoded
+        if self._escape:
+            self._escape = False
+            i += 1
+        while i < n:
+            q = chunk.find(b'"', i)
+            b = chunk.find(b'\\', i)
+            if q < 0:
+                q = n
+            if b < 0 or b > q:
+                return q
+            if b + 1 >= n:
+                self._escape = True
+                return n
+            i = b + 2
+        return n
+
+    def feed(self, chunk):
+        n = len(chunk)
+        i = 0
+        while i < n:
+            mode = self._mode
+            if mode == _STRING:
+                end = self._string_end(chunk, i, n)
+                if self._is_key or self._target is not None:
+                    self._collect(chunk[i:end])
+                if end >= n:
+                    return
+                i = end + 1
+                if self._is_key:
+                    self._stack[-1][1] = None if self._overflow else bytes(self._token)
+                    self._is_key = False
+                    self._mode = _COLON
+                else:
+                    self._end_value()
+                continue
+            if mode == _SKIP:
+                # Only brackets and strings matter until the container closes
+                if self._skip_string:
+                    end = self._string_end(chunk, i, n)
+                    if end >= n:
+                        return
+                    self._skip_string = False
+                    i = end + 1
+                    continue
+                depth = self._skip_depth
+                while i < n:
+                    c = chunk[i]
+                    i += 1
+                    if c == _QUOTE:
+                        self._skip_string = True
+                        break
+                    if c == 0x7B or c == 0x5B:
+                        depth += 1
+                    elif c == 0x7D or c == 0x5D:
+                        depth -= 1
+                        if depth == 0:
+                            self._mode = _AFTER if self._stack else _END
+                            break
+                self._skip_depth = depth
+                continue
+            if mode == _SCALAR:
+                end = i
+                while end < n:
+                    c = chunk[end]
+                    if _space(c) or c == 0x2C or c == 0x5D or c == 0x7D:    # , ] }
+                        break
+                    end += 1
+                if self._target is not None:
+                    self._collect(chunk[i:end])
+                i = end
+                if end < n:
+                    self._end_value()   # the delimiter is handled in _AFTER
+                continue
+            c = chunk[i]
+            i += 1
+            if _space(c):
+                continue
+            if mode == _VALUE:
+                self._begin(c)
+            elif mode == _FIRST:
+                if c == 0x5D:
+                    self._close(c)
+                else:
+                    self._begin(c)
+            elif mode == _KEY:
+                if c == _QUOTE:
+                    self._token[:] = b''
+                    self._overflow = False
+                    self._is_key = True
+                    self._mode = _STRING
+                elif c == 0x7D and self._stack[-1][1] is None:
+                    self._close(c)
+                else:
+                    raise ValueError('expected a key')
+            elif mode == _COLON:
+                if c != 0x3A:
+                    raise ValueError('expected :')
+                self._mode = _VALUE
+            elif mode == _AFTER:
+                if c == 0x2C:
+                    top = self._stack[-1]
+                    if top[0]:
+                        top[1] += 1
+                        self._mode = _VALUE
+                    else:
+                        top[1] = None
+                        self._mode = _KEY
+                elif c == 0x5D or c == 0x7D:
+                    self._close(c)
+                else:
+                    raise ValueError('expected , or end')
+            else:
+                raise ValueError('data after the end')
+
+    def close(self):
+        # Raises ValueError if the document was cut short
+        if self._mode == _SCALAR and not self._stack:
+            self._end_value()
+        if self._mode != _END:
+            raise ValueError('truncated JSON')
+
+
+def extract(chunks, paths, on_value):
+    # Runs a JsonExtractor over an iterable of chunks (bytes or bytearray)
+    parser = JsonExtractor(paths, on_value)
+    for chunk in chunks:
+        parser.feed(chunk)
+    parser.close()
@@ -0,0 +1,96 @@
+# Chooses between full and non-full (fast / partial) refreshes per update.
+#
+# Non-full updates only drive pixels that changed and are several times
+# quicker, but every one leaves a little ghosting behind. The scheduler keeps a
+# ghosting budget since the last full refresh: the number of non-full updates,
+# the panel area they touched and the time elapsed. A full refresh is sent when
+# any of them runs out, or when the change is big enough that a full refresh
+# costs little extra and resets the budget. State is kept in sleep memory so
+# the budget carries across deep sleep.
+
+FULL = 0
+FAST = 1        # whole-screen differential update
+PARTIAL = 2     # differential update of a window
+
+PANEL_AREA = 800 * 480
+
+
+class RefreshPolicy:
+    # Thresholds for RefreshScheduler. Areas are fractions of the panel, times
+    # are seconds. The *_time values are only used to estimate refresh cost.
+
+    def __init__(self, max_updates=8, max_area=1.5, max_age=12 * 3600, full_area=0.5,
+                 early_full_budget=0.75, early_full_area=0.2,
+                 full_time=4.0, fast_time=1.2, partial_time=1.2):
+        self.max_updates = max_updates          # non-full updates between full refreshes
+        self.max_area = max_area                # panels' worth of changed area between them
+        self.max_age = max_age                  # longest time without a full refresh
+        self.full_area = full_area              # a change this large always goes out full
+        self.early_full_budget = early_full_budget  # with this much budget used ...
+        self.early_full_area = early_full_area      # ... a change this large goes full early
+        self.full_time = full_time
+        self.fast_time = fast_time
+        self.partial_time = partial_time
+
+    def cost(self, kind):
+        if kind == FULL:
+            return self.full_time
+        if kind == PARTIAL:
+            return self.partial_time
+        return self.fast_time
+
+
+class RefreshScheduler:
+    def __init__(self, policy=None, state=None, region="refresh"):
+        # state is a sleepstate.SleepState; without one nothing is persisted
+        self.policy = policy if policy is not None else RefreshPolicy()
+        self.state = state
+        self.region = region
+        self.last_full = None   # time of the last full refresh, None if unknown
+        self.updates = 0        # non-full updates since then
+        self.area = 0           # pixels they changed, summed
+        if state is not None:
+            saved = state.load(region)
+            if saved is not None:
+                self.last_full, self.updates, self.area = saved
+                self.last_full = self.last_full or None
+
+    def budget_used(self, now):
+        # Largest fraction of any budget used so far, 1.0 or more means exhausted
+        if self.last_full is None:
+            return 1.0
+        policy = self.policy
+        used = self.updates / policy.max_updates
+        used = max(used, self.area / (policy.max_area * PANEL_AREA))
+        return max(used, (now - self.last_full) / policy.max_age)
+
+    def decide(self, changed_area, now, window=True, previous=True):
+        # Refresh kind for an update changing changed_area pixels at time now.
+        # window: the change is known as a rectangle (PARTIAL possible)
+        # previous: the frame on the panel is known (any differential update)
+        policy = self.policy
+        if not previous or self.last_full is None:
+            return FULL
+        if self.updates + 1 > policy.max_updates:
+            return FULL
+        if self.area + changed_area > policy.max_area * PANEL_AREA:
+            return FULL
+        if now - self.last_full >= policy.max_age:
+            return FULL
+        change = changed_area / PANEL_AREA
+        if change >= policy.full_area:
+            return FULL
+        if self.budget_used(now) >= policy.early_full_budget and change >= policy.early_full_area:
+            return FULL
+        return PARTIAL if window else FAST
+
+    def record(self, kind, changed_area, now):
+        if kind == FULL:
+            self.last_full = int(now)
+            self.updates = 0
+            self.area = 0
+        else:
+            self.updates += 1
+            self.area += int(changed_area)
+        if self.state is not None:
+            self.state.store(self.region, self.last_full or 0, self.updates, self.area)
@@ -0,0 +1,52 @@
+import struct
+
+# Layout of alarm.sleep_memory, which survives deep sleep but not a power cycle.
+# Every region starts with TAG, so a cold boot (zeroed or random RAM) reads as
+# empty instead of as garbage values.
+#
+#   name: (offset, struct format of the values after the tag)
+REGIONS = {
+    # crc32 of the frame on the panel, refreshes done, refreshes skipped
+    "frame": (0, "<III"),
+    # refreshsched: time of the last full refresh, non-full updates and the
+    # area they changed since then
+    "refresh": (16, "<IHI"),
+    # weather.WeatherSnapshot.to_bytes() of the last fetch, SNAPSHOT_SIZE bytes
+    # (checked when weather is imported)
+    "weather": (32, "<97s"),
+    # httpcache.HttpCache of the weather and time requests: time of the last
+    # response, its max-age, ETag and Last-Modified
+    "weather_http": (132, "<II48s29s"),
+    "time_http": (220, "<II48s29s"),
+}
+
+TAG = 0xE1D5
+_TAG_FORMAT = "<H"
+
+
+class SleepState:
+    def __init__(self, memory=None):
+        if memory is None:
+            import alarm
+            memory = alarm.sleep_memory
+        self.memory = memory
+
+    def load(self, name):
+        # Tuple of the region's values, None if it was never stored. The region
+        # is copied out first: SleepMemory only supports len(), indexing and
+        # slicing, not the buffer protocol unpack_from needs
+        offset, fmt = REGIONS[name]
+        tag_size = struct.calcsize(_TAG_FORMAT)
+        data = bytes(self.memory[offset:offset + tag_size + struct.calcsize(fmt)])
+        if struct.unpack_from(_TAG_FORMAT, data, 0)[0] != TAG:
+            return None
+        return struct.unpack_from(fmt, data, tag_size)
+
+    def store(self, name, *values):
+        offset, fmt = REGIONS[name]
+        data = struct.pack(_TAG_FORMAT, TAG) + struct.pack(fmt, *values)
+        self.memory[offset:offset + len(data)] = data
+
+    def erase(self, name):
+        offset, _ = REGIONS[name]
+        self.memory[offset:offset + struct.calcsize(_TAG_FORMAT)] = b'\x00\x00'
@@ -0,0 +1,96 @@
+import struct
+import time
+
+# Binary trace of what the EPD driver puts on the SPI bus, see EPD.start_trace
+# and tools/epd_trace.py.
+#
+#   header  4s magic "EPTR", B version, I baudrate
+#   record  B kind, varint microseconds since the previous record,
+#           varint length, then length payload bytes (one byte for REPEAT)
+#
+# A COMMAND, DATA or REPEAT record starts a transaction (CS low); MORE records
+# continue the data of the transaction before them. REPEAT stands for length
+# copies of its payload byte, so cleared planes cost a few bytes.
+
+MAGIC = b'EPTR'
+VERSION = 1
+HEADER = '<4sBI'
+
+COMMAND = 0
+DATA = 1
+MORE = 2
+REPEAT = 3
+
+
+class SpiTrace:
+    def __init__(self, stream, baudrate=8000000):
+        self.stream = stream
+        self.records = 0
+        self._varint_buf = bytearray(5)
+        self._last = time.monotonic_ns()
+        stream.write(struct.pack(HEADER, MAGIC, VERSION, baudrate))
+
+    def _varint(self, value):
+        buf = self._varint_buf
+        n = 0
+        while value > 0x7F:
+            buf[n] = (value & 0x7F) | 0x80
+            value >>= 7
+            n += 1
+        buf[n] = value
+        self.stream.write(memoryview(buf)[:n + 1])
+
+    def _record(self, kind, length):
+        now = time.monotonic_ns()
+        self.stream.write(bytes((kind,)))
+        self._varint((now - self._last) // 1000)
+        self._varint(length)
+        self._last = now
+        self.records += 1
+
+    def command(self, command):
+        self._record(COMMAND, 1)
+        self.stream.write(bytes((command,)))
+
+    def data(self, buf, more=False):
+        self._record(MORE if more else DATA, len(buf))
+        self.stream.write(buf)
+
+    def repeat(self, value, count):
+        self._record(REPEAT, count)
+        self.stream.write(bytes((value,)))
+
+    def close(self):
+        self.stream.close()
+
+
+def _read_varint(stream):
+    value = 0
+    shift = 0
+    while True:
+        b = stream.read(1)
+        if not b:
+            raise EOFError
+        value |= (b[0] & 0x7F) << shift
+        if not b[0] & 0x80:
+            return value
+        shift += 7
+
+
+def read_trace(stream):
+    # (baudrate, [(kind, microseconds since start, payload, length)]); payload is
+    # the single repeated byte for REPEAT records
+    magic, version, baudrate = struct.unpack(HEADER, stream.read(struct.calcsize(HEADER)))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('not an SPI trace')
+    records = []
+    elapsed = 0
+    while True:
+        kind = stream.read(1)
+        if not kind:
+            break
+        elapsed += _read_varint(stream)
+        length = _read_varint(stream)
+        payload = stream.read(1 if kind[0] == REPEAT else length)
+        records.append((kind[0], elapsed, payload, length))
+    return baudrate, records
@@ -5,8 +5,14 @@ import time
 
 import board
 import busio
+try:
+    import alarm    # light sleep while BUSY is asserted
+except ImportError:
+    alarm = None
 from digitalio import DigitalInOut, Direction, Pull
 from bmplib import BitmapHeader, BitmapHeaderInfo
+from fontpack import Font
+from glyphcache import GlyphCache, preshift
 
 # Display resolution
 EPD_WIDTH = 800
@@ -35,6 +41,9 @@ RESOLUTION_SETTING                        = 0x61
 GATE_SOURCE_START_SETTING                 = 0x65
 GET_STATUS                                = 0x71
 VCOM_DC                                   = 0x82
+PARTIAL_WINDOW                            = 0x90
+PARTIAL_IN                                = 0x91
+PARTIAL_OUT                               = 0x92
 
 # Display orientation
 ROTATE_0                                    = 0
@@ -42,14 +51,85 @@ ROTATE_90                                   = 1
 ROTATE_180                                  = 2
 ROTATE_270                                  = 3
 
+# Update modes for EPD.update()
+MODE_FULL                                   = 0
+MODE_FAST                                   = 1
+
+# Fast updates allowed before update() forces a full refresh to clear ghosting
+MAX_FAST_UPDATES                            = 5
+
+# Largest slice handed to spi.write() when streaming buffers
+SPI_CHUNK_SIZE                              = 4096
+
+SPI_BAUDRATE                                = 8000000
+
+# Longest BUSY wait before BusyTimeoutError, in seconds. A full refresh takes
+# a few seconds, longer in the cold
+BUSY_TIMEOUT                                = 30
+
+# Time BUSY takes to assert after DISPLAY_REFRESH, in seconds
+REFRESH_SETTLE                              = 0.1
+
+# Hardware reset: RST low for RESET_PULSE ms, then BUSY is waited for (the
+# controller holds it while it loads its OTP) once it had RESET_SETTLE ms to assert
+RESET_PULSE                                 = 2
+RESET_SETTLE                                = 10
+
+# One full row of set pixels, sliced by the span filler
+_ROW_ONES = b'\xff' * (EPD_WIDTH >> 3)
+_ROW_ZEROS = bytes(EPD_WIDTH >> 3)
+
+# Panel rows per strip in banded rendering: 80 rows are 8000 bytes
+BAND_ROWS                                   = 80
+
+# Strings whose measure_text() result is remembered
+TEXT_METRICS_CACHE_SIZE                     = 64
+
+def _bit_reverse_table():
+    # Integer arithmetic only: MicroPython has no str slices with a step
+    table = bytearray(256)
+    for i in range(256):
+        v = i
+        r = 0
+        for _ in range(8):
+            r = (r << 1) | (v & 1)
+            v >>= 1
+        table[i] = r
+    return bytes(table)
+
+# Bit-reversed byte values, for mirroring glyph rows under ROTATE_180
+_BIT_REVERSE = _bit_reverse_table()
+
+class BusyTimeoutError(RuntimeError):
+    # BUSY stayed asserted past EPD.busy_timeout: the controller is stuck or
+    # unpowered. command is the one being waited on, None if unknown
+    def __init__(self, command, timeout):
+        message = "EPD busy for more than {} s".format(timeout)
+        if command is not None:
+            message += " after command 0x{:02X}".format(command)
+        super().__init__(message)
+        self.command = command
+
+# The LUT command codes under other names: inside EPD the LUT_* names are the
+# waveforms, which shadow the module constants in the class body
+_LUT_VCOM = LUT_VCOM
+_LUT_BW = LUT_BW
+_LUT_WB = LUT_WB
+_LUT_BB = LUT_BB
+
 class EPD:
+    _shared = None
+
     def __init__(self, reset, dc, busy, cs, clk, mosi):
+        self.pins = (reset, dc, busy, cs, clk, mosi)
+        self.released = False           # set by module_exit
         self.reset_pin = DigitalInOut(reset)
         self.reset_pin.direction = Direction.OUTPUT
         
         self.dc_pin = DigitalInOut(dc)
         self.dc_pin.direction = Direction.OUTPUT
         
+        self._busy = busy
         self.busy_pin = DigitalInOut(busy)
         self.busy_pin.direction = Direction.INPUT
 
@@ -59,12 +139,45 @@ class EPD:
                 
         self.spi = busio.SPI(clk, mosi)
         self.spi.try_lock()
-        self.spi.configure(baudrate=8000000)
+        self.spi.configure(baudrate=SPI_BAUDRATE)
         self.spi.unlock()
         
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
         self.rotate = ROTATE_0
+
+        self._byte_buf = bytearray(1)   # reused by send_command / send_data
+        self._window_buf = bytearray(9) # PARTIAL_WINDOW parameters, see set_partial_window
+        self._mirror_buf = bytearray(0) # scratch row for mirrored glyph blits
+        self.glyph_cache = GlyphCache() # pre-shifted glyphs, set to None to disable
+        self._fonts = {}                # font*.py module -> fontpack.Font
+        self._text_metrics = {}         # (font, text) -> measure_text()
+        self.dirty = None               # DirtyRegion while tracking, see track_dirty
+        self.lut_mode = None            # waveform in the controller, set by load_luts
+        self.register_luts = False      # init() selected register LUTs, see load_luts
+        self.fast_updates = 0           # fast updates since the last full refresh
+        self.max_fast_updates = MAX_FAST_UPDATES
+        self.trace = None               # SpiTrace while recording, see start_trace
+        self.busy_timeout = BUSY_TIMEOUT
+        self.busy_sleep = alarm is not None # light sleep on a pin alarm during BUSY
+        self.busy_times = {}            # command -> seconds its last BUSY wait took
+        self._refresh = None            # (start, commands to send after) while refreshing
+        self.band_top = 0               # panel rows the frame buffer holds, see render_bands
+        self.band_bottom = EPD_HEIGHT
+        self._strip = None
+        self._configured = None         # init sequence the controller still runs with
+        self.reset_stats()
+
+    @classmethod
+    def shared(cls, reset, dc, busy, cs, clk, mosi):
+        # The driver made earlier in this session for the same pins while it still
+        # holds them (sleep() releases them), else a new one. Saves reconfiguring the
+        # pins and the SPI bus, and lets init() take its fast path
+        epd = cls._shared
+        if epd is None or epd.released or epd.pins != (reset, dc, busy, cs, clk, mosi):
+            epd = cls(reset, dc, busy, cs, clk, mosi)
+            cls._shared = epd
+        return epd
         
     VOLTAGE_FRAME = [
        0x6,0x3F,0x3F,0x11,0x24,0x7,0x17
@@ -119,118 +232,356 @@ class EPD:
 	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
 	0x0,	0x0,	0x0,	0x0,	0x0,	0x0
     ]   
-        
+
+    # Fast differential waveform, used with the old frame in DATA_TRANSMISSION_1 and
+    # the new one in DATA_TRANSMISSION_2. Only the final drive group of the full
+    # waveform is kept, for the two transitions that change a pixel; unchanged
+    # pixels (WW, BB) are held at GND for the same 30 frames.
+    LUT_VCOM_FAST = [
+	0x0,	0xF,	0xF,	0x0,	0x0,	0x1,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0	
+    ]
+
+    LUT_WW_FAST = [
+	0x0,	0xF,	0xF,	0x0,	0x0,	0x1,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0	
+    ]
+
+    LUT_BW_FAST = [
+	0x20,	0xF,	0xF,	0x0,	0x0,	0x1,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0	
+    ]
+
+    LUT_WB_FAST = [
+	0x40,	0xF,	0xF,	0x0,	0x0,	0x1,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0	
+    ]
+
+    LUT_BB_FAST = [
+	0x0,	0xF,	0xF,	0x0,	0x0,	0x1,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
+	0x0,	0x0,	0x0,	0x0,	0x0,	0x0	
+    ]
+
+    # Register programming as (command, payload, delay_ms after, wait for BUSY)
+    # entries, run by run_sequence with each payload sent as a single transfer.
+    # Panel revisions or waveform modes only need another table.
+    INIT_SEQUENCE = (
+        (POWER_SETTING, bytes((0x17,            # 1-0=11: internal power
+                               VOLTAGE_FRAME[6],    # VGH&VGL
+                               VOLTAGE_FRAME[1],    # VSH
+                               VOLTAGE_FRAME[2],    # VSL
+                               VOLTAGE_FRAME[3])),  # VSHR
+         0, False),
+        (VCOM_DC, bytes((VOLTAGE_FRAME[4],)), 0, False),   # VCOM
+        (BOOSTER_SOFT_START, b'\x27\x27\x2F\x17', 0, False),
+        (PLL_CONTROL, bytes((VOLTAGE_FRAME[0],)), 0, False),   # 2-0=100: N=4  ; 5-3=111: M=7  ;  3C=50Hz     3A=100HZ
+        (POWER_ON, b'', 100, True),
+        (PANEL_SETTING, b'\x3F', 0, False),  # KW-3f   KWR-2F BWROTP 0f BWOTP 1f
+        (RESOLUTION_SETTING, b'\x03\x20\x01\xE0', 0, False),  # source 800, gate 480
+        (DUAL_SPI_MODE, b'\x00', 0, False),
+        (VCOM_DATA_INTERVAL, b'\x10\x00', 0, False),
+        (TCON_SETTING, b'\x22', 0, False),
+        (GATE_SOURCE_START_SETTING, b'\x00\x00\x00\x00', 0, False),   # 800*480
+    )
+
+    # Waveshare's reference init: waveform from OTP (PANEL_SETTING 0x1F), so no
+    # LUT upload, and only full refreshes. After it, update() with MODE_FAST does
+    # full refreshes and the other fast and partial updates raise ValueError
+    INIT_SEQUENCE_OTP = (
+        (POWER_SETTING, b'\x07\x07\x3F\x3F', 0, False),
+        (BOOSTER_SOFT_START, b'\x17\x17\x28\x17', 0, False),
+        (POWER_ON, b'', 100, True),
+        (PANEL_SETTING, b'\x1F', 0, False),
+        (RESOLUTION_SETTING, b'\x03\x20\x01\xE0', 0, False),
+        (DUAL_SPI_MODE, b'\x00', 0, False),
+        (VCOM_DATA_INTERVAL, b'\x10\x07', 0, False),
+        (TCON_SETTING, b'\x22', 0, False),
+    )
+
+    # Commands through the _LUT_* aliases, see above
+    LUT_SEQUENCES = {
+        MODE_FULL: (
+            (_LUT_VCOM, bytes(LUT_VCOM), 0, False),
+            (_LUT_BW, bytes(LUT_WW), 0, False),
+            (LUT_BW2, bytes(LUT_BW), 0, False),
+            (_LUT_WB, bytes(LUT_WB), 0, False),
+            (_LUT_BB, bytes(LUT_BB), 0, False),
+        ),
+        MODE_FAST: (
+            (_LUT_VCOM, bytes(LUT_VCOM_FAST), 0, False),
+            (_LUT_BW, bytes(LUT_WW_FAST), 0, False),
+            (LUT_BW2, bytes(LUT_BW_FAST), 0, False),
+            (_LUT_WB, bytes(LUT_WB_FAST), 0, False),
+            (_LUT_BB, bytes(LUT_BB_FAST), 0, False),
+        ),
+    }
 
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000)
 
     def reset(self): # Hardware reset
-        self.reset_pin.value = True
-        self.delay_ms(200)
+        # The pin starts low (in reset) from the constructor or module_exit, so a
+        # single pulse is enough; BUSY then tells when the controller is ready
+        self._configured = None
         self.reset_pin.value = False
-        self.delay_ms(2)
+        self.delay_ms(RESET_PULSE)
         self.reset_pin.value = True
-        self.delay_ms(200)
+        self.delay_ms(RESET_SETTLE)
+        self.ReadBusy()
+
+    def reset_stats(self):  # SPI counters, compare before/after on the host simulator
+        self.spi_bytes = 0
+        self.spi_transactions = 0
+
+    def start_trace(self, stream):
+        # Logs every command and data transfer, timestamped, to stream (a file
+        # opened 'wb') until stop_trace(). Read back with tools/epd_trace.py
+        from spitrace import SpiTrace   # only imported once tracing is used
+        self.trace = SpiTrace(stream, SPI_BAUDRATE)
+        return self.trace
+
+    def stop_trace(self):
+        if self.trace is not None:
+            self.trace.close()
+            self.trace = None
 
     def _spi_transfer(self, data):
+        self._byte_buf[0] = data
         self.cs_pin.value = False
         self.spi.try_lock()
-        self.spi.write(bytes([data]))
+        self.spi.write(self._byte_buf)
         self.spi.unlock()
         self.cs_pin.value = True
+        self.spi_bytes += 1
+        self.spi_transactions += 1
         
     def send_command(self, command):
+        if self._refresh is not None:
+            self.finish_refresh()   # nothing may reach the controller mid-refresh
         self.dc_pin.value = False
         self._spi_transfer(command)
+        if self.trace is not None:
+            self.trace.command(command)
 
     def send_data(self, data):
         self.dc_pin.value = True
         self._spi_transfer(data)
+        if self.trace is not None:
+            self.trace.data(self._byte_buf)
 
-    def ReadBusy(self):
+    def _begin_data(self):  # DC high, CS low and the SPI lock held for a bulk transfer
+        self.dc_pin.value = True
+        self.cs_pin.value = False
+        while not self.spi.try_lock():
+            pass
+
+    def _end_data(self, count):
+        self.spi.unlock()
+        self.cs_pin.value = True
+        self.spi_bytes += count
+        self.spi_transactions += 1
+
+    def send_data_buffer(self, buf, start=0, end=None):
+        # Streams buf[start:end] as a single data transfer: DC, CS and the SPI lock
+        # are set once and the bytes go out in memoryview slices (no copies)
+        if end is None:
+            end = len(buf)
+        view = memoryview(buf)
+        trace = self.trace
+        self._begin_data()
+        for i in range(start, end, SPI_CHUNK_SIZE):
+            chunk = view[i:min(i + SPI_CHUNK_SIZE, end)]
+            self.spi.write(chunk)
+            if trace is not None:
+                trace.data(chunk, i != start)
+        self._end_data(end - start)
+
+    def send_data_rows(self, buf, start, row_len, stride, rows):
+        # Streams rows slices of row_len bytes, stride bytes apart, as one data transfer
+        view = memoryview(buf)
+        trace = self.trace
+        self._begin_data()
+        for row in range(start, start + rows * stride, stride):
+            self.spi.write(view[row:row + row_len])
+            if trace is not None:
+                trace.data(view[row:row + row_len], row != start)
+        self._end_data(row_len * rows)
+
+    def send_data_repeat(self, value, count):
+        # Sends the same data byte count times in one transfer
+        chunk = bytearray([value]) * min(count, SPI_CHUNK_SIZE)
+        self._begin_data()
+        remaining = count
+        while remaining > 0:
+            n = min(remaining, SPI_CHUNK_SIZE)
+            self.spi.write(chunk, end=n)
+            remaining -= n
+        self._end_data(count)
+        if self.trace is not None:
+            self.trace.repeat(value, count)
+
+    def ReadBusy(self, command=None, since=None):
+        # Waits for BUSY to drop, in light sleep until a pin alarm on it where the port
+        # has alarms, else polling every 5 ms. If the port refuses the pin alarm or
+        # light sleep, busy_sleep is turned off and it polls instead. Raises
+        # BusyTimeoutError after busy_timeout seconds. The wait, counted from since
+        # (default now), is recorded in busy_times[command]
+        start = time.monotonic() if since is None else since
+        deadline = start + self.busy_timeout
         while(self.busy_pin.value == True):      # 0: idle, 1: busy
-            self.delay_ms(5)
-            
-    def TurnOnDisplay(self):       # Showtime
+            if time.monotonic() >= deadline:
+                self._configured = None     # state unknown, the next init() resets
+                raise BusyTimeoutError(command, self.busy_timeout)
+            if self.busy_sleep:
+                try:
+                    self._sleep_while_busy(deadline)
+                except (ValueError, NotImplementedError, RuntimeError):
+                    self.busy_sleep = False     # not on this board, poll from now on
+            else:
+                self.delay_ms(5)
+        if command is not None:
+            self.busy_times[command] = time.monotonic() - start
+
+    def _sleep_while_busy(self, deadline):
+        # The pin alarm needs the pin to itself, so busy_pin is released meanwhile
+        self.busy_pin.deinit()
+        try:
+            alarm.light_sleep_until_alarms(alarm.pin.PinAlarm(self._busy, value=False),
+                                           alarm.time.TimeAlarm(monotonic_time=deadline))
+        finally:
+            self.busy_pin = DigitalInOut(self._busy)
+            self.busy_pin.direction = Direction.INPUT
+
+    def TurnOnDisplay(self, wait=True):       # Showtime
+        self.begin_refresh()
+        if wait:
+            self.finish_refresh()
+
+    def begin_refresh(self, after=()):
+        # Starts DISPLAY_REFRESH and returns at once, so other work can overlap the
+        # seconds it takes. Poll refresh_done(), await wait_refresh() or block in
+        # finish_refresh(); any later command finishes it first, so sleep() and the
+        # next update sequence themselves. The commands in after are sent when the
+        # refresh completes
         self.send_command(DISPLAY_REFRESH)
-        self.delay_ms(100)    
-        self.ReadBusy()
-
-    def init(self):
+        self._refresh = (time.monotonic(), after)
+
+    def refresh_done(self):
+        # True once the refresh begun by begin_refresh has completed
+        if self._refresh is None:
+            return True
+        elapsed = time.monotonic() - self._refresh[0]
+        if elapsed < REFRESH_SETTLE:
+            return False
+        if self.busy_pin.value == True:
+            if elapsed >= self.busy_timeout:
+                self._refresh = None
+                self._configured = None     # state unknown, the next init() resets
+                raise BusyTimeoutError(DISPLAY_REFRESH, self.busy_timeout)
+            return False
+        self.busy_times[DISPLAY_REFRESH] = elapsed
+        self._end_refresh()
+        return True
+
+    def finish_refresh(self):
+        # Blocks until the refresh begun by begin_refresh has completed
+        if self._refresh is None:
+            return
+        start = self._refresh[0]
+        settle = REFRESH_SETTLE - (time.monotonic() - start)
+        if settle > 0:
+            time.sleep(settle)
+        try:
+            self.ReadBusy(DISPLAY_REFRESH, start)
+        except BusyTimeoutError:
+            self._refresh = None
+            raise
+        self._end_refresh()
+
+    async def wait_refresh(self, interval=0.05):
+        # For asyncio tasks: yields every interval seconds until the refresh is done
+        import asyncio
+        while not self.refresh_done():
+            await asyncio.sleep(interval)
+
+    def _end_refresh(self):
+        after = self._refresh[1]
+        self._refresh = None
+        for command in after:
+            self.send_command(command)
+
+    def init(self, sequence=None):
+        # Resets the controller and runs sequence (default INIT_SEQUENCE). Tables
+        # selecting register LUTs (PANEL_SETTING bit 5) get the full waveform loaded.
+        # If this instance already ran sequence and the controller has not been put
+        # to sleep since, it is still configured and powered: only the full waveform
+        # is restored
+        if sequence is None:
+            sequence = self.INIT_SEQUENCE
+        if self._configured is sequence:
+            if self.lut_mode == MODE_FAST:
+                self.load_luts(MODE_FULL)
+            return 0
         self.reset()
-
-        self.send_command(POWER_SETTING)  
-        self.send_data(0x17)  # 1-0=11: internal power
-        self.send_data(self.VOLTAGE_FRAME[6])  # VGH&VGL
-        self.send_data(self.VOLTAGE_FRAME[1])  # VSH
-        self.send_data(self.VOLTAGE_FRAME[2])  #  VSL
-        self.send_data(self.VOLTAGE_FRAME[3])  #  VSHR
-
-        self.send_command(VCOM_DC)  
-        self.send_data(self.VOLTAGE_FRAME[4])  # VCOM
-
-        self.send_command(BOOSTER_SOFT_START)  
-        self.send_data(0x27)
-        self.send_data(0x27)
-        self.send_data(0x2F)
-        self.send_data(0x17)
-
-        self.send_command(PLL_CONTROL)   # OSC Setting
-        self.send_data(self.VOLTAGE_FRAME[0])  # 2-0=100: N=4  ; 5-3=111: M=7  ;  3C=50Hz     3A=100HZ
-
-        self.send_command(POWER_ON) #POWER ON
-        self.delay_ms(100)
-        self.ReadBusy()
-
-        self.send_command(PANEL_SETTING)
-        self.send_data(0x3F)   #KW-3f   KWR-2F BWROTP 0f BWOTP 1f
-
-        self.send_command(RESOLUTION_SETTING)        # tres
-        self.send_data(0x03) #source 800
-        self.send_data(0x20)
-        self.send_data(0x01) #gate 480
-        self.send_data(0xE0)
-
-        self.send_command(DUAL_SPI_MODE)
-        self.send_data(0x00)
-
-        self.send_command(VCOM_DATA_INTERVAL)
-        self.send_data(0x10)
-        self.send_data(0x00)
-
-        self.send_command(TCON_SETTING)
-        self.send_data(0x22)
-
-        self.send_command(GATE_SOURCE_START_SETTING) 
-        self.send_data(0x00)
-        self.send_data(0x00)   # 800*480
-        self.send_data(0x00)
-        self.send_data(0x00)
-        
-        self.send_command(LUT_VCOM) #VCOM
-        for count in range(42):
-            self.send_data(self.LUT_VCOM[count])
-
-        self.send_command(LUT_BW) #LUTBW
-        for count in range(42):
-            self.send_data(self.LUT_WW[count])
-
-        self.send_command(LUT_BW2) #LUTBW
-        for count in range(42):
-            self.send_data(self.LUT_BW[count])
-
-        self.send_command(LUT_WB) #LUTWB
-        for count in range(42):
-            self.send_data(self.LUT_WB[count])
-
-        self.send_command(LUT_BB) #LUTBB
-        for count in range(42):
-            self.send_data(self.LUT_BB[count])
-
+        self.run_sequence(sequence)
+        self.lut_mode = None
+        self.register_luts = False
+        for command, payload, _, _ in sequence:
+            if command == PANEL_SETTING:
+                self.register_luts = payload[0] & 0x20 != 0
+        if self.register_luts:
+            self.load_luts(MODE_FULL)
+        self._configured = sequence
         return 0
 
+    def run_sequence(self, sequence):
+        for command, payload, delay, wait_busy in sequence:
+            self.send_command(command)
+            start = time.monotonic()
+            if payload:
+                self.send_data_buffer(payload)
+            if delay:
+                self.delay_ms(delay)
+            if wait_busy:
+                self.ReadBusy(command, start)
+
+    def load_luts(self, mode):      # Uploads the waveform for MODE_FULL or MODE_FAST
+        # The controller ignores uploaded LUTs while it runs its OTP waveform, which
+        # would turn every fast update into a silent full refresh
+        if not self.register_luts:
+            raise ValueError("LUT waveforms need an init sequence with register LUTs (INIT_SEQUENCE)")
+        self.run_sequence(self.LUT_SEQUENCES[mode])
+        self.lut_mode = mode
+
     def module_exit(self):
         #logger.debug("spi end")
+        self.released = True
+        self._configured = None
         self.spi.deinit()
         self.reset_pin.value = False
         self.dc_pin.value = False
@@ -248,10 +599,11 @@ class EPD:
         # self.send_command(0x20)
 
         self.send_command(POWER_OFF)  # Enter deep sleep
-        self.ReadBusy()
+        self.ReadBusy(POWER_OFF)
         
         self.send_command(DEEP_SLEEP)
         self.send_data(0xA5)
+        self._configured = None     # only a reset wakes it
         
         self.delay_ms(2000)
         self.module_exit()
@@ -264,14 +616,10 @@ class EPD:
         # logger.debug(linewidth)
         
         self.send_command(DATA_TRANSMISSION_1)
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                self.send_data(0xFF)
+        self.send_data_repeat(0xFF, linewidth * self.height)
         
         self.send_command(DATA_TRANSMISSION_2)
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                self.send_data(0x00)
+        self.send_data_repeat(0x00, linewidth * self.height)
                 
         self.TurnOnDisplay()
         
@@ -283,14 +631,10 @@ class EPD:
         # logger.debug(linewidth)
         
         self.send_command(DATA_TRANSMISSION_1)
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                self.send_data(0x00)
+        self.send_data_repeat(0x00, linewidth * self.height)
         
         self.send_command(DATA_TRANSMISSION_2)
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                self.send_data(0xFF)
+        self.send_data_repeat(0xFF, linewidth * self.height)
                 
         self.TurnOnDisplay()
     
@@ -322,16 +666,269 @@ class EPD:
             linewidth = int(self.width >> 3) + 1
 
         self.send_command(DATA_TRANSMISSION_2)
-        for j in range(0, int(self.height)):
-            for i in range(0, int(self.width >> 3)):
-                self.send_data(image[i + j * linewidth])   
+        if linewidth == self.width >> 3:
+            self.send_data_buffer(image, 0, linewidth * self.height)
+        else:
+            for j in range(0, int(self.height)):
+                self.send_data_buffer(image, j * linewidth, j * linewidth + (self.width >> 3))
         self.TurnOnDisplay()
         
-    def display2(self, image):                     # Writes buffer into ram and updates screen
+    def display2(self, image, wait=True):          # Writes buffer into ram and updates screen
         self.send_command(DATA_TRANSMISSION_2)
-        for j in range(0, 48000):
-            self.send_data(image[j])   
-        self.TurnOnDisplay()
+        self.send_data_buffer(image, 0, 48000)
+        self.TurnOnDisplay(wait)
+
+    def display_fast(self, image, previous, wait=True):
+        # Differential update: the previous frame goes to DATA_TRANSMISSION_1 and the
+        # new one to DATA_TRANSMISSION_2, so the fast waveform only drives pixels that
+        # changed. previous must be what the panel currently shows. With wait=False
+        # this and the other display_* / update methods return once the refresh has
+        # started, see begin_refresh
+        if self.lut_mode != MODE_FAST:
+            self.load_luts(MODE_FAST)
+        self.send_command(DATA_TRANSMISSION_1)
+        self.send_data_buffer(previous, 0, 48000)
+        self.send_command(DATA_TRANSMISSION_2)
+        self.send_data_buffer(image, 0, 48000)
+        self.TurnOnDisplay(wait)
+
+    def update(self, image, previous=None, mode=MODE_FULL, wait=True):
+        # Shows image with the requested mode and returns the mode actually used.
+        # MODE_FAST falls back to a full refresh without the previous frame, after an
+        # OTP waveform init (see INIT_SEQUENCE_OTP), or once max_fast_updates fast
+        # updates have run since the last full one
+        if (mode == MODE_FAST and previous is not None and self.register_luts
+                and self.fast_updates < self.max_fast_updates):
+            self.display_fast(image, previous, wait)
+            self.fast_updates += 1
+            return MODE_FAST
+        if self.lut_mode == MODE_FAST:
+            self.load_luts(MODE_FULL)
+        self.display2(image, wait)
+        self.fast_updates = 0
+        return MODE_FULL
+
+# Partial window refresh
+
+    def align_window(self, x0, y0, x1, y1):
+        # Widens an inclusive panel rectangle to whole bytes (the controller addresses
+        # columns in groups of 8) and clips it to the panel. None if nothing is left
+        x0 = max(x0, 0) & ~0x7
+        x1 = min(x1, EPD_WIDTH - 1) | 0x7
+        y0 = max(y0, 0)
+        y1 = min(y1, EPD_HEIGHT - 1)
+        if x0 > x1 or y0 > y1:
+            return None
+        return (x0, y0, x1, y1)
+
+    def enter_partial(self):
+        self.send_command(PARTIAL_IN)
+
+    def exit_partial(self):
+        self.send_command(PARTIAL_OUT)
+
+    def set_partial_window(self, x0, y0, x1, y1):   # Byte aligned, see align_window
+        window = self._window_buf
+        window[0] = x0 >> 8
+        window[1] = x0 & 0xF8
+        window[2] = x1 >> 8
+        window[3] = (x1 & 0xFF) | 0x07
+        window[4] = y0 >> 8
+        window[5] = y0 & 0xFF
+        window[6] = y1 >> 8
+        window[7] = y1 & 0xFF
+        window[8] = 0x01        # PT_SCAN: gates scan inside and outside the window
+        self.send_command(PARTIAL_WINDOW)
+        self.send_data_buffer(window)
+
+    def send_window(self, frame_buffer, x0, y0, x1, y1):
+        # Sends the window's bytes of a full frame buffer, row by row, in one transfer
+        stride = EPD_WIDTH >> 3
+        self.send_data_rows(frame_buffer, y0 * stride + (x0 >> 3), (x1 >> 3) - (x0 >> 3) + 1,
+                            stride, y1 - y0 + 1)
+
+    def track_dirty(self, max_rects=None):
+        # Starts recording the panel area touched by the drawing primitives into
+        # self.dirty (a DirtyRegion, panel coordinates). max_rects=0 stops tracking
+        if max_rects == 0:
+            self.dirty = None
+            return None
+        from dirtyrect import DirtyRegion   # only imported once dirty tracking is used
+        if max_rects is None:
+            self.dirty = DirtyRegion()
+        else:
+            self.dirty = DirtyRegion(max_rects)
+        return self.dirty
+
+    def display_dirty(self, frame_buffer, wait=True):
+        # Flushes only what changed since the last flush: each dirty rectangle's bytes
+        # are written through its own partial window, then one partial refresh covers
+        # their bounds. The controller RAM must already hold the previous frame (sent
+        # earlier in this power cycle), since bytes outside the rectangles are not
+        # resent. Returns the refreshed window, None if nothing was dirty
+        if self.dirty is None:
+            return None
+        bounds = self.dirty.bounds()
+        window = self.align_window(*bounds) if bounds else None
+        if window is None:
+            return None
+        self.enter_partial()
+        for rect in self.dirty.rects:
+            rect = self.align_window(*rect)
+            self.set_partial_window(*rect)
+            self.send_command(DATA_TRANSMISSION_2)
+            self.send_window(frame_buffer, *rect)
+        self.set_partial_window(*window)
+        self.begin_refresh((PARTIAL_OUT,))
+        if wait:
+            self.finish_refresh()
+        self.dirty.clear()
+        return window
+
+    def display_partial(self, frame_buffer, x0, y0, x1, y1, previous=None, wait=True):
+        # Refreshes only the inclusive rectangle x0,y0 - x1,y1 (screen coordinates,
+        # rotated like set_pixel) from a full frame buffer. With the previous frame the
+        # window is updated differentially with the fast waveform, see display_fast.
+        # Returns the byte aligned panel window that was sent, or None if the
+        # rectangle is off screen
+        rect = self.to_absolute_rect(x0, y0, x1, y1)
+        window = self.align_window(*rect) if rect else None
+        if window is None:
+            return None
+        if previous is not None and self.lut_mode != MODE_FAST:
+            self.load_luts(MODE_FAST)
+        self.enter_partial()
+        self.set_partial_window(*window)
+        if previous is not None:
+            self.send_command(DATA_TRANSMISSION_1)
+            self.send_window(previous, *window)
+        self.send_command(DATA_TRANSMISSION_2)
+        self.send_window(frame_buffer, *window)
+        self.begin_refresh((PARTIAL_OUT,))     # partial mode ends after the refresh
+        if wait:
+            self.finish_refresh()
+        return window
+
+    def diff_region(self, old, new, max_rects=None, top=0, region=None):
+        # DirtyRegion of the panel bytes that differ between two full frame buffers,
+        # one byte aligned span per changed row merged as rows are added. Its area()
+        # is what a differential update actually drives, its bounds() the window.
+        # For bands, old and new hold the rows from panel row top on, and the spans
+        # are added to region (a new one if None)
+        if region is None:
+            from dirtyrect import DirtyRegion
+            region = DirtyRegion() if max_rects is None else DirtyRegion(max_rects)
+        stride = EPD_WIDTH >> 3
+        for y in range(len(new) // stride):
+            row = y * stride
+            if old[row:row + stride] == new[row:row + stride]:
+                continue
+            first = 0
+            while old[row + first] == new[row + first]:
+                first += 1
+            last = stride - 1
+            while old[row + last] == new[row + last]:
+                last -= 1
+            region.add(first << 3, top + y, (last << 3) | 0x7, top + y)
+        return region
+
+    def refresh_ram(self, mode=MODE_FULL, window=None, wait=True):
+        # Refreshes from what the controller RAM already holds, e.g. bands streamed by
+        # render_bands. MODE_FAST only drives the pixels whose DATA_TRANSMISSION_1 and
+        # DATA_TRANSMISSION_2 bits differ; a window (byte aligned, see align_window)
+        # limits the refresh to it
+        if mode == MODE_FAST and self.lut_mode != MODE_FAST:
+            self.load_luts(MODE_FAST)
+        elif mode == MODE_FULL and self.lut_mode == MODE_FAST:
+            self.load_luts(MODE_FULL)
+        if window is None:
+            self.begin_refresh()
+        else:
+            self.enter_partial()
+            self.set_partial_window(*window)
+            self.begin_refresh((PARTIAL_OUT,))
+        if wait:
+            self.finish_refresh()
+
+# Banded rendering
+
+    def _band_strip(self, rows):
+        # The reusable strip of rows panel rows, see render_bands
+        stride = EPD_WIDTH >> 3
+        if self._strip is None or len(self._strip) != rows * stride:
+            self._strip = None      # free the old one before allocating
+            self._strip = bytearray(rows * stride)
+        return self._strip
+
+    def render_bands(self, draw, sink, rows=BAND_ROWS, y0=0, y1=EPD_HEIGHT - 1):
+        # Renders the screen a band of rows panel rows at a time into one reusable
+        # strip, instead of a full frame buffer. draw(strip) draws the whole screen
+        # into strip as if it were a frame buffer; the primitives clip to the current
+        # band (band_top..band_bottom - 1). Then sink(band, top, count) gets the
+        # band's count rows, starting at panel row top, before the strip is cleared
+        # for the next band. The result is identical to full-frame rendering. Only
+        # the bands overlapping panel rows y0..y1 are drawn
+        stride = EPD_WIDTH >> 3
+        strip = self._band_strip(rows)
+        view = memoryview(strip)
+        try:
+            for top in range(y0 - y0 % rows, y1 + 1, rows):
+                bottom = min(top + rows, EPD_HEIGHT)
+                for row in range(0, len(strip), stride):
+                    strip[row:row + stride] = _ROW_ZEROS
+                self.band_top = top
+                self.band_bottom = bottom
+                draw(strip)
+                sink(view[:(bottom - top) * stride], top, bottom - top)
+        finally:
+            self.band_top = 0
+            self.band_bottom = EPD_HEIGHT
+
+    def display_bands(self, draw, rows=BAND_ROWS, wait=True):
+        # display2() for banded rendering: each band goes to DATA_TRANSMISSION_2 as
+        # soon as it is drawn
+        self.send_command(DATA_TRANSMISSION_2)
+        self.render_bands(draw, lambda band, top, count: self.send_data_buffer(band), rows)
+        self.refresh_ram(MODE_FULL, wait=wait)
+
+    def display_partial_bands(self, draw, window, previous, sink=None, rows=BAND_ROWS, wait=True):
+        # display_partial() for banded rendering, differential with the fast
+        # waveform: only the bands overlapping window (byte aligned panel
+        # coordinates, see align_window) are drawn, and only their bytes inside it
+        # are sent. previous(band, top, count) fills band with those rows of the
+        # frame the panel shows, for DATA_TRANSMISSION_1. Each new band then goes to
+        # sink(band, top, count), if given, once its window bytes are sent
+        x0, y0, x1, y1 = window
+        stride = EPD_WIDTH >> 3
+        start = x0 >> 3
+        row_len = (x1 >> 3) - start + 1
+
+        def send(band, top, count):
+            first = max(y0, top)
+            last = min(y1, top + count - 1)
+            self.send_data_rows(band, (first - top) * stride + start, row_len, stride, last - first + 1)
+
+        def send_new(band, top, count):
+            send(band, top, count)
+            if sink is not None:
+                sink(band, top, count)
+
+        if self.lut_mode != MODE_FAST:
+            self.load_luts(MODE_FAST)
+        self.enter_partial()
+        self.set_partial_window(*window)
+        self.send_command(DATA_TRANSMISSION_1)
+        view = memoryview(self._band_strip(rows))
+        for top in range(y0 - y0 % rows, y1 + 1, rows):
+            count = min(rows, EPD_HEIGHT - top)
+            band = view[:count * stride]
+            previous(band, top, count)
+            send(band, top, count)
+        self.send_command(DATA_TRANSMISSION_2)
+        self.render_bands(draw, send_new, rows, y0, y1)
+        self.begin_refresh((PARTIAL_OUT,))     # partial mode ends after the refresh
+        if wait:
+            self.finish_refresh()
 
 # For Drawing
 
@@ -359,26 +956,196 @@ class EPD:
         # To avoid display orientation effects
         # use EPD_WIDTH instead of self.width
         # use EPD_HEIGHT instead of self.height
-        if (x < 0 or x >= EPD_WIDTH or y < 0 or y >= EPD_HEIGHT):
+        if (x < 0 or x >= EPD_WIDTH or y < self.band_top or y >= self.band_bottom):
             return
-        frame_buffer[int((x + y * EPD_WIDTH) >> 3)] |= 0x80 >> (x & 0x7)
+        frame_buffer[int((x + (y - self.band_top) * EPD_WIDTH) >> 3)] |= 0x80 >> (x & 0x7)
+        if self.dirty is not None:
+            self.dirty.add(x, y, x, y)
         
+    def as_font(self, font):
+        # Drawing works on fontpack.Font; font*.py modules are wrapped once
+        if isinstance(font, Font):
+            return font
+        wrapped = self._fonts.get(font)
+        if wrapped is None:
+            wrapped = self._fonts[font] = Font.from_module(font)
+        return wrapped
+
     def draw_char_at(self, frame_buffer, x, y, char, font):
-        char_offset = (ord(char) - ord(' ')) * font.height * (int(font.width >> 3) + (1 if font.width & 0x7 else 0))
-        offset = 0
+        font = self.as_font(font)
+        row_bytes = font.row_bytes
+        box = font.ink_box(char)
+        if box is None:     # blank, or not in the font
+            return
+
+        if self.rotate != ROTATE_0 and self.rotate != ROTATE_180:
+            data, char_offset = font.locate(char)
+            if data is not None:
+                self._draw_char_pixels(frame_buffer, x, y, data, char_offset, font, box)
+            return
+
+        # Only the inked rows and bytes of the glyph are drawn. Visible part of
+        # that area in screen coordinates, end exclusive:
+        top, bottom, left, right = box
+        ink_x = x + (left << 3)
+        ink_width = min((right + 1) << 3, font.width) - (left << 3)
+        x0 = max(ink_x, 0)
+        x1 = min(ink_x + ink_width, self.width, EPD_WIDTH)
+        j0 = max(top, -y)
+        j1 = min(bottom + 1, self.height - y, EPD_HEIGHT - y)
+        if x0 >= x1 or j0 >= j1:
+            return
+
+        # Nothing to do when the ink misses the band being rendered
+        if self.rotate == ROTATE_0:
+            if y + j1 <= self.band_top or y + j0 >= self.band_bottom:
+                return
+        elif EPD_HEIGHT - y - j0 < self.band_top or EPD_HEIGHT - y - j1 + 1 >= self.band_bottom:
+            return
+
+        if self.rotate == ROTATE_0:
+            if (self.glyph_cache is not None and x0 == ink_x and x1 == ink_x + ink_width
+                    and j0 == top and j1 == bottom + 1):
+                self._draw_cached_char(frame_buffer, ink_x, y + top, char, font, box)
+                return
+
+        data, char_offset = font.locate(char)
+        if data is None:
+            return
+        char_offset += left
+        ink_bytes = right - left + 1
+        if self.rotate == ROTATE_0:
+            self.blit_absolute(frame_buffer, ink_x, y + j0, data, char_offset + j0 * row_bytes,
+                               ink_bytes, j1 - j0, x0, x1 - 1, stride=row_bytes)
+        else:
+            # Row j lands on panel row EPD_HEIGHT - y - j, mirrored; panel row/column
+            # EPD_HEIGHT/EPD_WIDTH fall off the edge just like in set_absolute_pixel
+            j0 = max(j0, 1 - y)
+            if j0 >= j1:
+                return
+            self.blit_absolute(frame_buffer, EPD_WIDTH - ink_x - ink_bytes * 8 + 1, EPD_HEIGHT - y - j0,
+                               data, char_offset + j0 * row_bytes, ink_bytes, j1 - j0,
+                               EPD_WIDTH - x1 + 1, min(EPD_WIDTH - x0, EPD_WIDTH - 1), True,
+                               stride=row_bytes)
+
+    def _draw_cached_char(self, frame_buffer, x, y, char, font, box):
+        # Unclipped ROTATE_0 glyph: OR the cached copy of its inked area, pre-shifted
+        # to x & 7, byte by byte. x, y is the top left corner of the inked area
+        shift = x & 0x7
+        top, bottom, left, right = box
+        width = min((right + 1) << 3, font.width) - (left << 3)
+        rows = bottom - top + 1
+        if self.dirty is not None:
+            self.dirty.add(x, y, x + width - 1, y + rows - 1)
+        r0 = max(0, self.band_top - y)  # rows inside the band
+        r1 = min(rows, self.band_bottom - y)
+        if r0 >= r1:
+            return
+        glyph = self.glyph_cache.get(font, char, shift)
+        if glyph is None:
+            data, char_offset = font.locate(char)
+            if data is None:
+                return
+            glyph = preshift(data, char_offset + top * font.row_bytes + left, width, rows, shift,
+                             font.row_bytes)
+            self.glyph_cache.put(font, char, shift, glyph)
+        out_bytes = (shift + width + 7) >> 3
+        stride = EPD_WIDTH >> 3
+        row = (y + r0 - self.band_top) * stride + (x >> 3)
+        i = r0 * out_bytes
+        for r in range(r0, r1):
+            for k in range(row, row + out_bytes):
+                v = glyph[i]
+                if v:
+                    frame_buffer[k] |= v
+                i += 1
+            row += stride
+
+    def _draw_char_pixels(self, frame_buffer, x, y, data, char_offset, font, box):
+        # Bit-by-bit renderer over the inked area, used for the 90/270 degree rotations
+        top, bottom, left, right = box
+        row_bytes = font.row_bytes
         
-        for j in range(font.height):
-            for i in range(font.width):
-                if font.data[char_offset+offset] & (0x80 >> (i & 0x7)):
+        for j in range(top, bottom + 1):
+            offset = char_offset + j * row_bytes
+            for i in range(left << 3, min((right + 1) << 3, font.width)):
+                if data[offset + (i >> 3)] & (0x80 >> (i & 0x7)):
                     # Previously self.set_pixel(frame_buffer, x + i, y + j) but reoriented
                     # Possible orientations (frame_buffer, y + j, x + i), (frame_buffer, y + j, x - i), (frame_buffer, y + j, x + i)
                     self.set_pixel(frame_buffer, x + i, y + j)
-                if i & 0x7 == 7:
-                    offset += 1
-            if font.width & 0x7 != 0:
-                offset += 1
+
+    def blit_absolute(self, frame_buffer, x, y, src, start, row_bytes, rows, clip_x0, clip_x1, mirror=False,
+                      stride=None):
+        # ORs a 1bpp bitmap (MSB first, row_bytes per row, rows stride bytes apart in src)
+        # into the panel with its first bit at column x of row y. Unaligned x is handled
+        # by splitting every source byte across two frame bytes. Only columns
+        # clip_x0..clip_x1 (inclusive, already on the panel) are touched. With mirror each
+        # source row is bit-reversed and the rows run upwards from y, which is what
+        # ROTATE_180 needs.
+        if stride is None:
+            stride = row_bytes
+        shift = x & 0x7
+        spill = 8 - shift
+        col = x >> 3
+        first = clip_x0 >> 3
+        last = clip_x1 >> 3
+        left_mask = 0xFF >> (clip_x0 & 0x7)
+        right_mask = (0xFF << (7 - (clip_x1 & 0x7))) & 0xFF
+        step = -(EPD_WIDTH >> 3) if mirror else EPD_WIDTH >> 3
+        if self.dirty is not None and rows > 0:
+            if mirror:
+                self.dirty.add(clip_x0, y - rows + 1, clip_x1, y)
+            else:
+                self.dirty.add(clip_x0, y, clip_x1, y + rows - 1)
+        # Source rows that land inside the band; row r goes to panel row y + r, or
+        # y - r when mirrored
+        if mirror:
+            r0 = max(0, y - self.band_bottom + 1)
+            r1 = min(rows, y - self.band_top + 1)
+        else:
+            r0 = max(0, self.band_top - y)
+            r1 = min(rows, self.band_bottom - y)
+        if r0 >= r1:
+            return
+        if mirror:
+            if len(self._mirror_buf) < row_bytes:
+                self._mirror_buf = bytearray(row_bytes)
+            line = self._mirror_buf
+        else:
+            line = src
+        row = (y - r0 if mirror else y + r0) - self.band_top
+        row *= EPD_WIDTH >> 3
+        for r in range(r0, r1):
+            offset = start + r * stride
+            if mirror:
+                for k in range(row_bytes):
+                    line[k] = _BIT_REVERSE[src[offset + row_bytes - 1 - k]]
+                offset = 0
+            for k in range(row_bytes):
+                b = line[offset + k]
+                if not b:
+                    continue
+                c = col + k
+                v = b >> shift
+                if v and first <= c <= last:
+                    if c == first:
+                        v &= left_mask
+                    if c == last:
+                        v &= right_mask
+                    frame_buffer[row + c] |= v
+                if shift:
+                    c += 1
+                    v = (b << spill) & 0xFF
+                    if v and first <= c <= last:
+                        if c == first:
+                            v &= left_mask
+                        if c == last:
+                            v &= right_mask
+                        frame_buffer[row + c] |= v
+            row += step
 
     def display_string_at(self, frame_buffer, x, y, text, font):
+        font = self.as_font(font)
         refcolumn = x
         
         # Send the string character by character on EPD
@@ -389,6 +1156,49 @@ class EPD:
             # Decrement the column position by 16
             refcolumn += font.width
 
+    def measure_text(self, text, font):
+        # (advance, ink_left, ink_right) of text in pixels, relative to the string
+        # origin, ink_right exclusive. A string without ink gives (advance, 0, 0)
+        font = self.as_font(font)
+        key = (font, text)
+        metrics = self._text_metrics.get(key)
+        if metrics is None:
+            ink_left = None
+            ink_right = 0
+            for index in range(len(text)):
+                extent = font.ink_extent(text[index])
+                if extent is not None:
+                    if ink_left is None:
+                        ink_left = index * font.width + extent[0]
+                    ink_right = index * font.width + extent[1]
+            metrics = (len(text) * font.width, ink_left or 0, ink_right)
+            if len(self._text_metrics) >= TEXT_METRICS_CACHE_SIZE:
+                self._text_metrics.clear()
+            self._text_metrics[key] = metrics
+        return metrics
+
+    def draw_text(self, frame_buffer, x, y, text, font, align="left", box=None):
+        # Draws text with its ink aligned to x: "left" starts the ink at x, "right"
+        # ends it just before x, "center" centres it on x. With box=(x0, x1) the ink
+        # is aligned inside columns x0..x1 (inclusive) instead and x is ignored.
+        # Returns the string origin that was used for display_string_at.
+        advance, ink_left, ink_right = self.measure_text(text, font)
+        if box is not None:
+            if align == "right":
+                x = box[1] + 1
+            elif align == "center":
+                x = (box[0] + box[1] + 1) // 2
+            else:
+                x = box[0]
+        if align == "right":
+            x -= ink_right
+        elif align == "center":
+            x -= (ink_left + ink_right) // 2
+        else:
+            x -= ink_left
+        self.display_string_at(frame_buffer, x, y, text, font)
+        return x
+
     def draw_line(self, frame_buffer, x0, y0, x1, y1):
         # Bresenham algorithm
         dx = abs(x1 - x0)
@@ -406,12 +1216,10 @@ class EPD:
                 y0 += sy
 
     def draw_horizontal_line(self, frame_buffer, x, y, width):
-        for i in range(x, x + width):
-            self.set_pixel(frame_buffer, i, y)
+        self.fill_rect(frame_buffer, x, y, x + width - 1, y)
 
     def draw_vertical_line(self, frame_buffer, x, y, height):
-        for i in range(y, y + height):
-            self.set_pixel(frame_buffer, x, i)
+        self.fill_rect(frame_buffer, x, y, x, y + height - 1)
 
     def draw_rectangle(self, frame_buffer, x0, y0, x1, y1):
         min_x = x0 if x1 > x0 else x1
@@ -428,8 +1236,69 @@ class EPD:
         max_x = x1 if x1 > x0 else x0
         min_y = y0 if y1 > y0 else y1
         max_y = y1 if y1 > y0 else y0
-        for i in range(min_x, max_x + 1):
-            self.draw_vertical_line(frame_buffer, i, min_y, max_y - min_y + 1)
+        self.fill_rect(frame_buffer, min_x, min_y, max_x, max_y)
+
+    def fill_rect(self, frame_buffer, x0, y0, x1, y1):
+        # Inclusive corners, x0 <= x1 and y0 <= y1. Same pixels as calling set_pixel
+        # on every point: clip to the logical screen, rotate, then fill byte spans
+        if x0 < 0:
+            x0 = 0
+        if y0 < 0:
+            y0 = 0
+        if x1 >= self.width:
+            x1 = self.width - 1
+        if y1 >= self.height:
+            y1 = self.height - 1
+        if x0 > x1 or y0 > y1:
+            return
+        rect = self.to_absolute_rect(x0, y0, x1, y1)
+        if rect is not None:
+            self.fill_absolute_rect(frame_buffer, *rect)
+
+    def to_absolute_rect(self, x0, y0, x1, y1):
+        # Maps an inclusive screen rectangle to panel coordinates the way set_pixel
+        # maps points. Not clipped; None for an unknown rotation
+        if (self.rotate == ROTATE_0):
+            return (x0, y0, x1, y1)
+        elif (self.rotate == ROTATE_90):
+            return (EPD_WIDTH - y1, x0, EPD_WIDTH - y0, x1)
+        elif (self.rotate == ROTATE_180):
+            return (EPD_WIDTH - x1, EPD_HEIGHT - y1, EPD_WIDTH - x0, EPD_HEIGHT - y0)
+        elif (self.rotate == ROTATE_270):
+            return (y0, EPD_HEIGHT - x1, y1, EPD_HEIGHT - x0)
+        return None
+
+    def fill_absolute_rect(self, frame_buffer, x0, y0, x1, y1):
+        # Span rasterizer in panel coordinates: whole bytes are written directly,
+        # the partial bytes at either end of a row are ORed with edge masks
+        if x0 < 0:
+            x0 = 0
+        if y0 < self.band_top:
+            y0 = self.band_top
+        if x1 >= EPD_WIDTH:
+            x1 = EPD_WIDTH - 1
+        if y1 >= self.band_bottom:
+            y1 = self.band_bottom - 1
+        if x0 > x1 or y0 > y1:
+            return
+        if self.dirty is not None:
+            self.dirty.add(x0, y0, x1, y1)
+        y0 -= self.band_top
+        y1 -= self.band_top
+        row_bytes = EPD_WIDTH >> 3
+        first = x0 >> 3
+        last = x1 >> 3
+        left_mask = 0xFF >> (x0 & 0x7)
+        right_mask = (0xFF << (7 - (x1 & 0x7))) & 0xFF
+        if first == last:
+            left_mask &= right_mask
+        middle = _ROW_ONES[:last - first - 1] if last > first + 1 else None
+        for row in range(y0 * row_bytes, (y1 + 1) * row_bytes, row_bytes):
+            frame_buffer[row + first] |= left_mask
+            if last > first:
+                frame_buffer[row + last] |= right_mask
+                if middle:
+                    frame_buffer[row + first + 1:row + last] = middle
 
     def draw_circle(self, frame_buffer, x, y, radius):
         # Bresenham algorithm
@@ -0,0 +1,129 @@
+import struct
+from array import array
+
+import sleepstate
+
+# Weather shown on the screen, from the One Call response, in fixed point:
+# temperatures in tenths of a degree (in the API's units), PoP in percent and
+# rain in tenths of mm/h. to_bytes() packs it into SNAPSHOT_SIZE bytes for
+# alarm.sleep_memory or flash.
+#
+#   B version, I fetch time, h temp, B humidity, h rain (NO_RAIN: no minutely
+#   data), I dt of the first hour, HOURS h hourly temps, DAYS h highs, DAYS h
+#   lows, DAYS B PoP
+
+HOURS = 24
+DAYS = 7
+MINUTES = 60
+NO_RAIN = -1
+
+VERSION = 1
+_FORMAT = "<BIhBhI{}h{}h{}h{}B".format(HOURS, DAYS, DAYS, DAYS)
+SNAPSHOT_SIZE = struct.calcsize(_FORMAT)
+# The sleep memory region holding it is laid out in sleepstate, which does not
+# import this module (dark wakes never load it), so the two sizes are checked here
+assert struct.calcsize(sleepstate.REGIONS["weather"][1]) == SNAPSHOT_SIZE, \
+    "sleepstate weather region is not SNAPSHOT_SIZE bytes"
+
+# What is read from the One Call response, see read_onecall
+ONECALL_PATHS = {
+    ("current", "temp"): "temp",
+    ("current", "humidity"): "humidity",
+    ("hourly", HOURS, "dt"): "hour_dt",
+    ("hourly", HOURS, "temp"): "hour_temp",
+    ("daily", DAYS, "temp", "max"): "high",
+    ("daily", DAYS, "temp", "min"): "low",
+    ("daily", DAYS, "pop"): "pop",
+    ("minutely", MINUTES, "precipitation"): "rain",
+}
+
+
+def tenths(value):
+    # Rounded down, so that whole() gives exactly the value rounded half up,
+    # not a rounding of a rounding
+    return int(value * 10 // 1)
+
+
+def whole(tenths):
+    # Tenths to the nearest whole number, halves up
+    return (tenths + 5) // 10
+
+
+class WeatherSnapshot:
+    __slots__ = ("fetched", "temp", "humidity", "rain", "hour_start", "hour_temp",
+                 "high", "low", "pop")
+
+    def __init__(self, fetched=0):
+        self.fetched = int(fetched)     # epoch seconds of the fetch
+        self.temp = 0
+        self.humidity = 0
+        self.rain = NO_RAIN
+        self.hour_start = 0             # dt of hour_temp[0], one hour apart
+        self.hour_temp = array("h", [0] * HOURS)
+        self.high = array("h", [0] * DAYS)
+        self.low = array("h", [0] * DAYS)
+        self.pop = array("B", [0] * DAYS)
+
+    def to_bytes(self):
+        return struct.pack(_FORMAT, VERSION, self.fetched, self.temp, self.humidity, self.rain,
+                           self.hour_start, *(tuple(self.hour_temp) + tuple(self.high) +
+                                              tuple(self.low) + tuple(self.pop)))
+
+    @staticmethod
+    def from_bytes(data, offset=0):
+        # None unless data holds a snapshot of this VERSION at offset
+        if len(data) - offset < SNAPSHOT_SIZE or data[offset] != VERSION:
+            return None
+        values = struct.unpack_from(_FORMAT, data, offset)
+        snapshot = WeatherSnapshot(values[1])
+        snapshot.temp, snapshot.humidity, snapshot.rain, snapshot.hour_start = values[2:6]
+        i = 6
+        snapshot.hour_temp = array("h", values[i:i + HOURS])
+        i += HOURS
+        snapshot.high = array("h", values[i:i + DAYS])
+        snapshot.low = array("h", values[i + DAYS:i + 2 * DAYS])
+        snapshot.pop = array("B", values[i + 2 * DAYS:i + 3 * DAYS])
+        return snapshot
+
+
+def read_onecall(chunks, fetched):
+    # WeatherSnapshot of a One Call response given as an iterable of chunks, e.g.
+    # response.iter_content(), streamed through jsonstream. The rain is the
+    # average minutely precipitation. Raises ValueError if values other than
+    # the rain are missing. jsonstream is imported here, as wakes that only
+    # unpack a snapshot do not need it
+    import jsonstream
+    snapshot = WeatherSnapshot(fetched)
+    rain = [0, 0]   # sum, count
+    found = {}
+
+    def store(name, indices, value):
+        i = indices[0] if indices else 0
+        found[name] = found.get(name, 0) + 1
+        if name == "temp":
+            snapshot.temp = tenths(value)
+        elif name == "humidity":
+            snapshot.humidity = int(value)
+        elif name == "hour_dt":
+            if i == 0:
+                snapshot.hour_start = int(value)
+        elif name == "hour_temp":
+            snapshot.hour_temp[i] = tenths(value)
+        elif name == "high":
+            snapshot.high[i] = tenths(value)
+        elif name == "low":
+            snapshot.low[i] = tenths(value)
+        elif name == "pop":
+            snapshot.pop[i] = int(round(value * 100))
+        elif name == "rain":
+            rain[0] += value
+            rain[1] += 1
+
+    jsonstream.extract(chunks, ONECALL_PATHS, store)
+    for name, count in (("temp", 1), ("humidity", 1), ("hour_dt", HOURS), ("hour_temp", HOURS),
+                        ("high", DAYS), ("low", DAYS), ("pop", DAYS)):
+        if found.get(name, 0) < count:
+            raise ValueError("One Call response without {}".format(name))
+    if rain[1]:
+        snapshot.rain = tenths(rain[0] / rain[1])
+    return snapshot
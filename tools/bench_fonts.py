@@ -0,0 +1,65 @@
+# Host benchmark: import time and peak heap of the font*.py modules versus
+# the binary font pack, each measured in a fresh interpreter.
+#
+#   python tools/bench_fonts.py
+
+import os
+import subprocess
+import sys
+import tempfile
+
+LIB = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib')
+
+# Glyphs drawn by one buffer_screen frame
+FRAME_TEXT = (('font100', 'WED18'), ('font76', '7245%'), ('font50', '0123456789'))
+
+MODULES = '''
+import font50, font76, font100
+fonts = {'font50': font50, 'font76': font76, 'font100': font100}
+'''
+
+PACK = '''
+import fontpack
+pack = fontpack.FontPack(os.path.join(LIB, 'fonts.bin'))
+fonts = pack.fonts
+'''
+
+PROBE = '''
+import os, sys, time, tracemalloc
+LIB = {lib!r}
+sys.path.insert(0, LIB)
+tracemalloc.start()
+start = time.perf_counter()
+{setup}
+elapsed = time.perf_counter() - start
+for name, text in {frame!r}:
+    font = fonts[name]
+    for char in text:
+        glyph = getattr(font, 'glyph', None)
+        glyph(char) if glyph else font.data
+print(elapsed * 1000, tracemalloc.get_traced_memory()[1] / 1024)
+'''
+
+
+def probe(setup, cold):
+    # cold: sources compiled on import, like a first boot after copying files.
+    # warm: second run against the bytecode cache left by the first
+    code = PROBE.format(lib=LIB, setup=setup, frame=FRAME_TEXT)
+    with tempfile.TemporaryDirectory() as cache:
+        env = dict(os.environ, PYTHONPYCACHEPREFIX=cache)
+        for _ in range(1 if cold else 2):
+            out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                 env=env, check=True)
+    return [float(v) for v in out.stdout.split()]
+
+
+def main():
+    print('{:<28} {:>12} {:>12}'.format('', 'import ms', 'peak KB'))
+    for label, setup in (('font*.py modules', MODULES), ('fonts.bin pack', PACK)):
+        for cold in (True, False):
+            ms, kb = probe(setup, cold)
+            print('{:<28} {:>12.1f} {:>12.1f}'.format(label + (' (cold)' if cold else ' (warm)'), ms, kb))
+
+
+if __name__ == '__main__':
+    main()
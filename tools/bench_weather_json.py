@@ -0,0 +1,115 @@
+# Host benchmark: peak heap and parse time of get_weather's One Call parsing,
+# json.loads of the whole response (what response.json() does) versus the
+# streaming extractor in lib/jsonstream.py, over the recorded responses in
+# host/fixtures. Each fixture is also run inflated (four times the hourly,
+# minutely and alert entries) to show the extractor's heap does not grow with
+# the payload. The extracted values are checked against json.loads.
+#
+#   python tools/bench_weather_json.py [--runs 5]
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'lib'))
+
+import jsonstream  # noqa: E402
+from weather import ONECALL_PATHS  # noqa: E402
+
+CHUNK_SIZES = (256, 512, 1024)
+
+
+def inflate(body):
+    doc = json.loads(body)
+    for key in ('hourly', 'minutely', 'alerts'):
+        if key in doc:
+            doc[key] = doc[key] * 4
+    return json.dumps(doc, separators=(',', ':')).encode()
+
+
+def expected(body):
+    # The values get_weather reads, the way it read them from response.json()
+    doc = json.loads(body)
+    values = {'temp': doc['current']['temp'], 'humidity': doc['current']['humidity'],
+              'hour_dt': {}, 'hour_temp': {}, 'high': {}, 'low': {}, 'pop': {}, 'rain': {}}
+    for i in range(24):
+        values['hour_dt'][i] = doc['hourly'][i]['dt']
+        values['hour_temp'][i] = doc['hourly'][i]['temp']
+    for i in range(7):
+        values['high'][i] = doc['daily'][i]['temp']['max']
+        values['low'][i] = doc['daily'][i]['temp']['min']
+        values['pop'][i] = doc['daily'][i]['pop']
+    for i, minute in enumerate(doc['minutely'][:60]):
+        values['rain'][i] = minute['precipitation']
+    return values
+
+
+def chunks(body, size):
+    # Like iter_content: a new bytes object per read
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+
+def parse_whole(body):
+    content = b''.join(chunks(body, 1024))     # response.content
+    return json.loads(content)
+
+
+def parse_stream(body, size):
+    values = {}
+
+    def store(name, indices, value):
+        if indices:
+            values.setdefault(name, {})[indices[0]] = value
+        else:
+            values[name] = value
+    jsonstream.extract(chunks(body, size), ONECALL_PATHS, store)
+    return values
+
+
+def measure(parse, runs):
+    # (best time in ms, peak heap in KB, result)
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = parse()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    result = parse()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best * 1000, peak / 1024, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark One Call parsing')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    print('{:<34} {:>10} {:>10} {:>10}'.format('', 'bytes', 'parse ms', 'peak KB'))
+    for path in sorted(glob.glob(os.path.join(ROOT, 'host', 'fixtures', 'onecall*.json'))):
+        with open(path, 'rb') as f:
+            raw = f.read()
+        for label, body in ((os.path.basename(path), raw), ('  inflated', inflate(raw))):
+            print(label)
+            ms, kb, _ = measure(lambda: parse_whole(body), args.runs)
+            print('{:<34} {:>10d} {:>10.2f} {:>10.1f}'.format('  response.json()', len(body), ms, kb))
+            want = expected(body)
+            for size in CHUNK_SIZES:
+                ms, kb, got = measure(lambda: parse_stream(body, size), args.runs)
+                ok = got == want
+                failed |= not ok
+                print('{:<34} {:>10d} {:>10.2f} {:>10.1f}{}'.format(
+                    '  jsonstream, {} B chunks'.format(size), len(body), ms, kb, '' if ok else '  WRONG VALUES'))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+# Host check of banded rendering (EPD.render_bands): draws random screens in
+# every rotation both into a full frame buffer and band by band, fails if any
+# byte differs, and compares the peak heap of the two ways of rendering.
+#
+#   python tools/check_bands.py [--screens 20] [--seed 1]
+
+import argparse
+import os
+import random
+import sys
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'host'))
+sys.path.insert(1, os.path.join(ROOT, 'lib'))
+
+import sim  # noqa: E402
+
+# Band heights to check besides the default; 7 and 33 do not divide 480
+BAND_HEIGHTS = (7, 33, 480)
+
+
+def random_screen(rng, fonts):
+    # One screen as a list of (method, args) calls, in screen coordinates
+    calls = []
+    for _ in range(rng.randrange(5, 25)):
+        x = rng.randrange(-40, 820)
+        y = rng.randrange(-40, 500)
+        kind = rng.randrange(6)
+        if kind == 0:
+            calls.append(('draw_filled_rectangle', (x, y, x + rng.randrange(60), y + rng.randrange(60))))
+        elif kind == 1:
+            calls.append(('draw_rectangle', (x, y, x + rng.randrange(200), y + rng.randrange(200))))
+        elif kind == 2:
+            calls.append(('draw_line', (x, y, rng.randrange(800), rng.randrange(480))))
+        elif kind == 3:
+            calls.append(('draw_circle', (x, y, rng.randrange(1, 60))))
+        elif kind == 4:
+            calls.append(('draw_filled_circle', (x, y, rng.randrange(1, 40))))
+        else:
+            text = ''.join(rng.choice('0123456789%° MONTUEWEDSAT!') for _ in range(rng.randrange(1, 6)))
+            calls.append(('display_string_at', (x, y, text, rng.choice(fonts))))
+    return calls
+
+
+def rotate(epd, rotation, waveshare75):
+    epd.rotate = rotation
+    swap = rotation in (waveshare75.ROTATE_90, waveshare75.ROTATE_270)
+    epd.width = waveshare75.EPD_HEIGHT if swap else waveshare75.EPD_WIDTH
+    epd.height = waveshare75.EPD_WIDTH if swap else waveshare75.EPD_HEIGHT
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check banded rendering against full frames')
+    parser.add_argument('--screens', type=int, default=20, help='random screens per rotation')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    sim.start().install()
+    import board
+    import fontpack
+    import waveshare75
+
+    pack = fontpack.FontPack(os.path.join(ROOT, 'lib', 'fonts.bin'))
+    fonts = [pack['font50'], pack['font76'], pack['font100']]
+    epd = waveshare75.EPD(board.D1, board.D3, board.D2, board.D4, board.SCK, board.MOSI)
+    rng = random.Random(args.seed)
+    size = waveshare75.EPD_WIDTH * waveshare75.EPD_HEIGHT >> 3
+    failures = 0
+    checked = 0
+    for rotation in (waveshare75.ROTATE_0, waveshare75.ROTATE_90, waveshare75.ROTATE_180,
+                     waveshare75.ROTATE_270):
+        rotate(epd, rotation, waveshare75)
+        for _ in range(args.screens):
+            calls = random_screen(rng, fonts)
+
+            def draw(frame):
+                for method, call_args in calls:
+                    getattr(epd, method)(frame, *call_args)
+
+            full = bytearray(size)
+            draw(full)
+            for rows in (waveshare75.BAND_ROWS,) + BAND_HEIGHTS:
+                banded = bytearray()
+                epd.render_bands(draw, lambda band, top, count: banded.extend(band), rows)
+                checked += 1
+                if banded != full:
+                    failures += 1
+                    first = next(i for i in range(size) if banded[i] != full[i])
+                    print('rotation {} band {} rows: first difference at row {}'.format(
+                        rotation, rows, first // (waveshare75.EPD_WIDTH >> 3)))
+    print('{} banded renders checked, {} differ'.format(checked, failures))
+
+    # Peak heap of rendering one screen and handing it to a sink, as code_7 does
+    rotate(epd, waveshare75.ROTATE_0, waveshare75)
+    calls = random_screen(rng, fonts)
+
+    def draw(frame):
+        for method, call_args in calls:
+            getattr(epd, method)(frame, *call_args)
+
+    tracemalloc.start()
+    frame = bytearray(size)
+    draw(frame)
+    _, full_peak = tracemalloc.get_traced_memory()
+    frame = None
+    tracemalloc.stop()
+    epd._strip = None       # allocated inside the measurement, like the first band of a wake
+    tracemalloc.start()
+    epd.render_bands(draw, lambda band, top, count: None)
+    _, band_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('peak heap: full frame {:.1f} KB, {} row bands {:.1f} KB ({:.1f} KB less)'.format(
+        full_peak / 1024, waveshare75.BAND_ROWS, band_peak / 1024, (full_peak - band_peak) / 1024))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+# Host check of partial refresh (EPD.display_partial, EPD.display_partial_bands)
+# on the virtual UC8179 (host/uc8179.py). In every rotation, for random screens
+# and a random change to each, the panel is fully refreshed with the old screen,
+# then partially refreshed to the new one through a window around the change.
+# Fails if DATA_TRANSMISSION_1 or DATA_TRANSMISSION_2 carried more or fewer
+# bytes than the window holds, or if the panel then shows anything but what a
+# full refresh of the new screen shows.
+#
+# Dirty tracking (EPD.track_dirty, EPD.display_dirty) is checked the same way
+# with one call of each drawing primitive as the change: every pixel it
+# changed must lie in a rectangle it recorded, and display_dirty must send
+# only those rectangles' bytes and leave the panel as a full refresh would.
+#
+#   python tools/check_partial.py [--screens 10] [--seed 1]
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+import check_bands
+import sim  # noqa: E402  (host/, put on the path by check_bands)
+
+
+def screen_rect(rect, rotation, waveshare75):
+    # Inverse of EPD.to_absolute_rect: the screen rectangle of a panel one
+    W = waveshare75.EPD_WIDTH
+    H = waveshare75.EPD_HEIGHT
+    x0, y0, x1, y1 = rect
+    if rotation == waveshare75.ROTATE_90:
+        return (y0, W - x1, y1, W - x0)
+    if rotation == waveshare75.ROTATE_180:
+        return (W - x1, H - y1, W - x0, H - y0)
+    if rotation == waveshare75.ROTATE_270:
+        return (H - y1, x0, H - y0, x1)
+    return rect
+
+
+def window_size(window):
+    x0, y0, x1, y1 = window
+    return ((x1 >> 3) - (x0 >> 3) + 1) * (y1 - y0 + 1)
+
+
+def write_bmp(path, rng, width=45, height=30):
+    # A random 1 bpp BMP for draw_bmp_at. draw_bmp_at counts rows back from two
+    # bytes before the end of the file, hence the trailing padding
+    line_width = ((width + 7) // 8 + 3) & ~3
+    pixels = bytes(rng.randrange(256) for _ in range(line_width * height))
+    offset = 14 + 40 + 8
+    size = offset + len(pixels) + 2
+    with open(path, 'wb') as f:
+        f.write(b'BM' + size.to_bytes(4, 'little') + bytes(4) + offset.to_bytes(4, 'little'))
+        f.write((40).to_bytes(4, 'little') + width.to_bytes(4, 'little') + height.to_bytes(4, 'little') +
+                (1).to_bytes(2, 'little') + (1).to_bytes(2, 'little') + bytes(4) +
+                len(pixels).to_bytes(4, 'little') + bytes(16))
+        f.write(b'\x00\x00\x00\x00\xff\xff\xff\x00' + pixels + bytes(2))
+
+
+def random_primitive(rng, fonts, kind, bmp_path):
+    # One call of drawing primitive kind as (method, args), in screen coordinates
+    x = rng.randrange(-40, 820)
+    y = rng.randrange(-40, 500)
+    text = ''.join(rng.choice('0123456789%° MONTUEWEDSAT!') for _ in range(rng.randrange(1, 6)))
+    if kind == 'set_pixel':
+        return (kind, (x, y))
+    if kind in ('draw_line', 'draw_rectangle', 'draw_filled_rectangle'):
+        return (kind, (x, y, x + rng.randrange(-100, 100), y + rng.randrange(-100, 100)))
+    if kind == 'fill_rect':
+        return (kind, (x, y, x + rng.randrange(100), y + rng.randrange(100)))
+    if kind in ('draw_horizontal_line', 'draw_vertical_line'):
+        return (kind, (x, y, rng.randrange(1, 200)))
+    if kind in ('draw_circle', 'draw_filled_circle'):
+        return (kind, (x, y, rng.randrange(1, 60)))
+    if kind == 'draw_char_at':
+        return (kind, (x, y, rng.choice(text), rng.choice(fonts)))
+    if kind == 'display_string_at':
+        return (kind, (x, y, text, rng.choice(fonts)))
+    if kind == 'draw_text':
+        align = rng.choice(('left', 'center', 'right'))
+        box = (x, x + rng.randrange(300)) if rng.randrange(2) else None
+        return (kind, (x, y, text, rng.choice(fonts), align, box))
+    return ('draw_bmp_at', (x, y, bmp_path))
+
+
+PRIMITIVES = ('set_pixel', 'draw_line', 'draw_horizontal_line', 'draw_vertical_line', 'draw_rectangle',
+              'draw_filled_rectangle', 'fill_rect', 'draw_circle', 'draw_filled_circle', 'draw_char_at',
+              'display_string_at', 'draw_text', 'draw_bmp_at')
+
+
+class Checker:
+    def __init__(self, epd, panel, waveshare75):
+        self.epd = epd
+        self.panel = panel
+        self.waveshare75 = waveshare75
+        self.size = waveshare75.EPD_WIDTH * waveshare75.EPD_HEIGHT >> 3
+        self.checked = 0
+        self.failures = 0
+
+    def render(self, calls):
+        frame = bytearray(self.size)
+        for method, call_args in calls:
+            getattr(self.epd, method)(frame, *call_args)
+        return frame
+
+    def sent(self):
+        stats = self.panel.stats
+        return (stats.get(self.waveshare75.DATA_TRANSMISSION_1, [0, 0])[1],
+                stats.get(self.waveshare75.DATA_TRANSMISSION_2, [0, 0])[1])
+
+    def check(self, label, old, new, refresh, expected=None):
+        # Shows old with a full refresh, runs refresh() (which returns the panel
+        # window it sent) and compares the result with a full refresh of new.
+        # expected: bytes DATA_TRANSMISSION_1 and _2 should carry, by default
+        # the window's for both
+        self.epd.update(old)
+        before = self.sent()
+        window = refresh()
+        after = self.sent()
+        shown = bytes(self.panel.shown)
+        self.epd.update(new)
+        self.checked += 1
+        problems = []
+        if expected is None:
+            expected = (window_size(window), window_size(window))
+        if (after[0] - before[0], after[1] - before[1]) != expected:
+            problems.append('sent {} / {} bytes instead of {} / {}'.format(
+                after[0] - before[0], after[1] - before[1], *expected))
+        if shown != bytes(self.panel.shown):
+            first = next(i for i in range(self.size) if shown[i] != self.panel.shown[i])
+            problems.append('panel differs from a full refresh at row {}'.format(
+                first // (self.waveshare75.EPD_WIDTH >> 3)))
+        if problems:
+            self.failures += 1
+            print('{}, window {}: {}'.format(label, window, '; '.join(problems)))
+
+    def check_dirty(self, label, calls, call):
+        # Draws call over the screen calls with dirty tracking on, checks that
+        # every pixel it changed is inside a recorded rectangle, then shows the
+        # change with display_dirty
+        old = self.render(calls)
+        new = bytearray(old)
+        dirty = self.epd.track_dirty()
+        getattr(self.epd, call[0])(new, *call[1])
+        self.epd.track_dirty(0)
+        stride = self.waveshare75.EPD_WIDTH >> 3
+        outside = 0
+        for i in range(self.size):
+            changed = old[i] ^ new[i]
+            if not changed:
+                continue
+            y = i // stride
+            for bit in range(8):
+                x = (i % stride) * 8 + bit
+                if changed & (0x80 >> bit) and not any(
+                        r[0] <= x <= r[2] and r[1] <= y <= r[3] for r in dirty.rects):
+                    outside += 1
+        if outside:
+            self.failures += 1
+            print('{} {}: {} changed pixels outside {}'.format(label, call, outside, dirty.rects))
+        self.checked += 1
+        if not dirty.rects:
+            return
+        rects = [self.epd.align_window(*r) for r in dirty.rects]
+        expected = (0, sum(window_size(r) for r in rects if r))
+
+        def refresh():
+            self.epd.dirty = dirty
+            return self.epd.display_dirty(new)
+
+        self.check('{} display_dirty {}'.format(label, call[0]), old, new, refresh, expected)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check partial refresh on the virtual panel')
+    parser.add_argument('--screens', type=int, default=10, help='random screens per rotation')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    simulator = sim.start().install()
+    import board
+    import fontpack
+    import waveshare75
+
+    pack = fontpack.FontPack(os.path.join(check_bands.ROOT, 'lib', 'fonts.bin'))
+    fonts = [pack['font50'], pack['font76'], pack['font100']]
+    epd = waveshare75.EPD(board.D1, board.D3, board.D2, board.D4, board.SCK, board.MOSI)
+    epd.init()
+    checker = Checker(epd, simulator.panel, waveshare75)
+    rng = random.Random(args.seed)
+    bmp_path = os.path.join(tempfile.mkdtemp(), 'check.bmp')
+    write_bmp(bmp_path, rng)
+    for rotation in (waveshare75.ROTATE_0, waveshare75.ROTATE_90, waveshare75.ROTATE_180,
+                     waveshare75.ROTATE_270):
+        check_bands.rotate(epd, rotation, waveshare75)
+        done = 0
+        while done < args.screens:
+            calls = check_bands.random_screen(rng, fonts)
+            change = check_bands.random_screen(rng, fonts)[:rng.randrange(1, 4)]
+            old = checker.render(calls)
+            new = checker.render(calls + change)
+            bounds = epd.diff_region(old, new).bounds()
+            if bounds is None:
+                continue    # the change fell off screen or under the old drawing
+            done += 1
+            # A screen rectangle around the change, with some margin
+            x0, y0, x1, y1 = screen_rect(bounds, rotation, waveshare75)
+            rect = (x0 - rng.randrange(20), y0 - rng.randrange(20), x1 + rng.randrange(20),
+                    y1 + rng.randrange(20))
+            checker.check('rotation {} display_partial'.format(rotation), old, new,
+                          lambda: epd.display_partial(new, *rect, previous=old))
+
+            def previous(band, top, count):
+                stride = waveshare75.EPD_WIDTH >> 3
+                band[:] = old[top * stride:(top + count) * stride]
+
+            def draw(frame):
+                for method, call_args in calls + change:
+                    getattr(epd, method)(frame, *call_args)
+
+            window = epd.align_window(*bounds)
+
+            def banded():
+                epd.display_partial_bands(draw, window, previous)
+                return window
+
+            checker.check('rotation {} display_partial_bands'.format(rotation), old, new, banded)
+        for _ in range(args.screens):
+            calls = check_bands.random_screen(rng, fonts)
+            for kind in PRIMITIVES:
+                checker.check_dirty('rotation {}'.format(rotation), calls,
+                                    random_primitive(rng, fonts, kind, bmp_path))
+    print('{} partial refreshes and dirty regions checked, {} failed'.format(checker.checked, checker.failures))
+    sys.exit(1 if checker.failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+# SPI traces of the EPD driver (lib/spitrace.py): record one on the host
+# simulator, print per-command statistics, or diff two of them.
+#
+#   python tools/epd_trace.py record out.bin [--lib DIR] [--png panel.png]
+#   python tools/epd_trace.py stats trace.bin
+#   python tools/epd_trace.py diff old.bin new.bin
+#
+# record runs a fixed workload (init, Clear, two frames, sleep) through the
+# driver in --lib, so traces of two checkouts can be compared. stats replays a
+# trace against the virtual UC8179 and shows, per command, how often it was
+# sent, the transactions and bytes it took and the time those bytes spend on
+# the wire at the trace's baudrate. diff checks that two traces program the
+# controller identically (same commands, same data, same final image) and
+# shows where their transaction and byte counts differ; it exits 1 if they
+# are not functionally identical.
+
+import argparse
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'host'))
+sys.path.insert(1, os.path.join(ROOT, 'lib'))
+
+import sim  # noqa: E402
+import uc8179  # noqa: E402
+import spitrace  # noqa: E402
+
+
+def record(path, lib, png):
+    if lib:
+        sys.path.insert(1, os.path.abspath(lib))
+    simulator = sim.start().install()
+    import board
+    import font50
+    import waveshare75
+
+    epd = waveshare75.EPD(board.D1, board.D3, board.D2, board.D4, board.SCK, board.MOSI)
+    epd.start_trace(open(path, 'wb'))
+    epd.init()
+    epd.Clear()
+    frame = bytearray(48000)
+    epd.draw_filled_rectangle(frame, 0, 103, 800, 108)
+    epd.draw_filled_rectangle(frame, 415, 0, 420, 108)
+    epd.display_string_at(frame, 10, 5, "TUE 18", font50)
+    epd.draw_rectangle(frame, 50, 225, 750, 400)
+    epd.display(frame)
+    epd.display_string_at(frame, 450, 10, "72", font50)
+    epd.display(frame)
+    epd.sleep()
+    epd.stop_trace()
+    if png:
+        simulator.panel.save(png)
+    simulator.uninstall()
+
+
+def load(path):
+    with open(path, 'rb') as f:
+        return spitrace.read_trace(f)
+
+
+def commands(records):
+    # [(command, data bytes, transactions)] in the order sent
+    out = []
+    for kind, _, payload, length in records:
+        if kind == spitrace.COMMAND:
+            out.append([payload[0], bytearray(), 1])
+            continue
+        if not out:
+            out.append([None, bytearray(), 0])
+        if kind == spitrace.REPEAT:
+            out[-1][1].extend(payload * length)
+        else:
+            out[-1][1].extend(payload)
+        if kind != spitrace.MORE:
+            out[-1][2] += 1
+    return out
+
+
+def replay(records):
+    # The virtual controller after the trace, driven at the recorded times
+    clock = sim.Clock()
+    panel = uc8179.UC8179(clock, sim.TIMING)
+    for kind, elapsed, payload, length in records:
+        clock.now = elapsed / 1e6
+        if kind == spitrace.COMMAND:
+            panel.write_command(payload[0])
+        elif kind == spitrace.REPEAT:
+            panel.write_data(payload * length)
+        else:
+            panel.write_data(payload)
+    return panel
+
+
+def summarize(cmds):
+    # command -> [count, transactions, bytes including the command byte]
+    table = {}
+    for command, data, transactions in cmds:
+        row = table.setdefault(command, [0, 0, 0])
+        row[0] += 1
+        row[1] += transactions
+        row[2] += len(data) + (command is not None)
+    return table
+
+
+def name(command):
+    return '(no command)' if command is None else uc8179.command_name(command)
+
+
+def stats(path):
+    baudrate, records = load(path)
+    table = summarize(commands(records))
+    panel = replay(records)
+    print('{}: {} records, {:.3f} s, {} baud'.format(
+        path, len(records), records[-1][1] / 1e6 if records else 0, baudrate))
+    print('{:28} {:>6} {:>13} {:>8} {:>10}'.format('command', 'count', 'transactions', 'bytes', 'wire ms'))
+    totals = [0, 0, 0]
+    for command in sorted(table, key=lambda c: -1 if c is None else c):
+        row = table[command]
+        print('{:28} {:6d} {:13d} {:8d} {:10.3f}'.format(name(command), row[0], row[1], row[2],
+                                                         row[2] * 8000 / baudrate))
+        totals = [t + r for t, r in zip(totals, row)]
+    print('{:28} {:6d} {:13d} {:8d} {:10.3f}'.format('total', totals[0], totals[1], totals[2],
+                                                     totals[2] * 8000 / baudrate))
+    for when, message in panel.errors:
+        print('panel: {} at {:.3f} s'.format(message, when))
+
+
+def diff(path_a, path_b):
+    _, records_a = load(path_a)
+    _, records_b = load(path_b)
+    cmds_a = commands(records_a)
+    cmds_b = commands(records_b)
+    table_a = summarize(cmds_a)
+    table_b = summarize(cmds_b)
+    print('{:28} {:>20} {:>20}'.format('command', 'transactions', 'bytes'))
+    for command in sorted(set(table_a) | set(table_b), key=lambda c: -1 if c is None else c):
+        a = table_a.get(command, [0, 0, 0])
+        b = table_b.get(command, [0, 0, 0])
+        mark = '' if a[1:] == b[1:] else ' *'
+        print('{:28} {:>9d} -> {:<8d} {:>9d} -> {:<8d}{}'.format(name(command), a[1], b[1], a[2], b[2], mark))
+    total_a = [sum(r[i] for r in table_a.values()) for i in (1, 2)]
+    total_b = [sum(r[i] for r in table_b.values()) for i in (1, 2)]
+    print('{:28} {:>9d} -> {:<8d} {:>9d} -> {:<8d}'.format('total', total_a[0], total_b[0], total_a[1], total_b[1]))
+
+    stream_a = [(c, bytes(d)) for c, d, _ in cmds_a]
+    stream_b = [(c, bytes(d)) for c, d, _ in cmds_b]
+    if stream_a != stream_b:
+        for i, (a, b) in enumerate(zip(stream_a, stream_b)):
+            if a != b:
+                print('differs at command {}: {} ({} bytes) vs {} ({} bytes)'.format(
+                    i, name(a[0]), len(a[1]), name(b[0]), len(b[1])))
+                break
+        else:
+            print('differs: {} commands vs {}'.format(len(stream_a), len(stream_b)))
+        return 1
+    if replay(records_a).shown != replay(records_b).shown:
+        print('same commands, different final image')
+        return 1
+    print('functionally identical')
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record, inspect and compare EPD SPI traces')
+    sub = parser.add_subparsers(dest='action', required=True)
+    p = sub.add_parser('record')
+    p.add_argument('output')
+    p.add_argument('--lib', help='driver directory to record (default: lib/)')
+    p.add_argument('--png', help='save the final panel image')
+    p = sub.add_parser('stats')
+    p.add_argument('trace')
+    p = sub.add_parser('diff')
+    p.add_argument('old')
+    p.add_argument('new')
+    args = parser.parse_args()
+
+    if args.action == 'record':
+        record(args.output, args.lib, args.png)
+    elif args.action == 'stats':
+        stats(args.trace)
+    else:
+        sys.exit(diff(args.old, args.new))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# Host tool: packs the font*.py modules in lib/ into one indexed binary file
+# that lib/fontpack.py reads glyph by glyph.
+#
+#   python tools/make_fontpack.py [-o lib/fonts.bin] [font50 font76 ...]
+
+import argparse
+import importlib
+import os
+import struct
+import sys
+
+LIB = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib')
+sys.path.insert(0, LIB)
+
+from fontpack import BLANK, FONT_ENTRY, GLYPH_ENTRY, HEADER, MAGIC, VERSION, ink_box
+
+DEFAULT_FONTS = ('font50', 'font76', 'font100', 'font211')
+
+DEGREE = 0xB0   # not in the font*.py charsets, drawn by degree_glyph()
+
+
+def load_font(name):
+    module = importlib.import_module(name)
+    row_bytes = (module.width >> 3) + (1 if module.width & 0x7 else 0)
+    glyph_bytes = row_bytes * module.height
+    count = len(module.data) // glyph_bytes
+    # The modules hold a contiguous run of glyphs starting at space
+    glyphs = [(0x20 + i, module.data[i * glyph_bytes:(i + 1) * glyph_bytes]) for i in range(count)]
+    return module.width, module.height, glyphs
+
+
+def degree_glyph(width, height, glyphs):
+    # Ring with an outer diameter of 40% of the cell width, its top level with
+    # the top of the digits. It hugs the left of the cell so that it reads as
+    # part of the number before it.
+    row_bytes = (width >> 3) + (1 if width & 0x7 else 0)
+    top = ink_box(dict(glyphs)[ord('0')], 0, row_bytes, height)[0]
+    outer = width * 0.2
+    inner = outer * 0.55
+    cx = max(1, width // 10) + outer
+    cy = top + outer
+    bitmap = bytearray(row_bytes * height)
+    for j in range(height):
+        for i in range(width):
+            d2 = (i + 0.5 - cx) ** 2 + (j + 0.5 - cy) ** 2
+            if inner * inner <= d2 <= outer * outer:
+                bitmap[j * row_bytes + (i >> 3)] |= 0x80 >> (i & 0x7)
+    return bytes(bitmap)
+
+
+def build_pack(fonts):
+    # fonts: list of (name, width, height, [(codepoint, bitmap), ...])
+    header_size = struct.calcsize(HEADER) + len(fonts) * struct.calcsize(FONT_ENTRY)
+    entries = []
+    body = bytearray()
+    for name, width, height, glyphs in fonts:
+        glyphs = sorted(glyphs)
+        row_bytes = (width >> 3) + (1 if width & 0x7 else 0)
+        index_offset = header_size + len(body)
+        for codepoint, bitmap in glyphs:
+            box = ink_box(bitmap, 0, row_bytes, height) or (BLANK, 0, 0, 0)
+            body += struct.pack(GLYPH_ENTRY, codepoint, *box)
+        data_offset = header_size + len(body)
+        for _, bitmap in glyphs:
+            body += bitmap
+        entries.append(struct.pack(FONT_ENTRY, name.encode(), width, height, len(glyphs), 0,
+                                   index_offset, data_offset))
+    return struct.pack(HEADER, MAGIC, VERSION, len(fonts), 0) + b''.join(entries) + bytes(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack font*.py modules into a binary font pack')
+    parser.add_argument('fonts', nargs='*', default=DEFAULT_FONTS)
+    parser.add_argument('-o', '--output', default=os.path.join(LIB, 'fonts.bin'))
+    args = parser.parse_args()
+
+    fonts = []
+    for name in args.fonts:
+        width, height, glyphs = load_font(name)
+        glyphs.append((DEGREE, degree_glyph(width, height, glyphs)))
+        fonts.append((name, width, height, glyphs))
+        print('{}: {}x{}, {} glyphs'.format(name, width, height, len(glyphs)))
+    pack = build_pack(fonts)
+    with open(args.output, 'wb') as f:
+        f.write(pack)
+    print('wrote {} ({} bytes)'.format(os.path.normpath(args.output), len(pack)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+# Host profile of code_7's imports and heap per wake path. Runs the script on
+# the host simulator (see host/run.py) against the stand-in APIs for four
+# wakes that take each path once:
+#
+#   fetch     daylight, no weather in sleep memory: Wi-Fi, time and weather
+#   cached    daylight, weather in sleep memory younger than its max age
+#   dark      no light, the panel still shows a frame: it is cleared
+#   dark      no light, the panel is already blank
+#
+# and reports, per wake, the modules it imported with their import time
+# (inclusive of the modules they import in turn), and the peak and retained
+# heap of the wake as tracemalloc sees it. Only the board's modules are listed
+# (lib/ and the host stand-ins for CircuitPython's own); host library modules
+# the stand-ins pull in count towards their importer. The script and its
+# libraries are compiled beforehand, as they would be as .mpy, so neither
+# figure includes the compiler, but the heap does include the stand-ins' own
+# allocations. Times are host times, only useful to compare paths and
+# revisions; they come from a run without tracemalloc.
+#
+#   python tools/profile_wakes.py ["code_7 - ....py"] [--top 12]
+
+import argparse
+import builtins
+import gc
+import glob
+import os
+import py_compile
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'host'))
+
+import run  # noqa: E402
+import sim  # noqa: E402
+import standin  # noqa: E402
+
+SCRIPT = os.path.join(ROOT, 'code_7 - TinyS3 -  Weather - New Light Sensor.py')
+# Light from 06:00 to 21:00: 20:00 fetches, 20:30 reads the cache, 21:00 and
+# 22:00 are dark
+START = '2024-02-09 20:00'
+DARK = '21-6'
+WAKES = 4
+
+
+class ImportTimer:
+    # Wraps builtins.__import__ and records, for each module loaded for the first
+    # time, its name, the time its import took and the nesting depth
+    def __init__(self):
+        self.loaded = []
+        self._depth = 0
+        self._original = None
+
+    def __enter__(self):
+        self._original = builtins.__import__
+        builtins.__import__ = self._import
+        return self
+
+    def __exit__(self, *exc):
+        builtins.__import__ = self._original
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._original(name, globals, locals, fromlist, level)
+        depth = self._depth
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            self._depth = depth
+            self.loaded.append((name, (time.perf_counter() - start) * 1000, depth))
+
+
+def board_modules(loaded, script):
+    # The entries of ImportTimer.loaded that are modules of the board
+    dirs = tuple(os.path.abspath(d) + os.sep for d in (os.path.join(ROOT, 'lib'), os.path.join(ROOT, 'host'),
+                                                       os.path.dirname(script)))
+    found = []
+    for name, ms, depth in loaded:
+        module = sys.modules.get(name)
+        path = getattr(module, '__file__', None)
+        if path is None and name in sys.builtin_module_names:
+            path = dirs[1]      # gc: built into CircuitPython too
+        if path and os.path.abspath(path).startswith(dirs):
+            found.append((name, ms, depth))
+    return found
+
+
+def preload_host_libraries(script):
+    # Imports the host library modules the stand-ins use, so that they stay
+    # loaded across wakes and are neither timed nor traced as the board's
+    names = [os.path.splitext(os.path.basename(p))[0] for p in glob.glob(os.path.join(ROOT, 'host', '*.py'))]
+    before = set(sys.modules)
+    # pkgutil: imported by runpy.run_path, which run_wake calls
+    for name in names + ['alarm', 'pkgutil']:
+        __import__(name)
+    loaded = [(name, 0, 0) for name in set(sys.modules) - before]
+    for name, _, _ in board_modules(loaded, script):
+        del sys.modules[name]
+
+
+def run_wakes(script, compiled, traced):
+    # [(label, imports, peak heap, retained heap)] for WAKES wakes of script,
+    # run from its bytecode in compiled
+    simulator = sim.start(root=os.path.dirname(script), writable=True, epoch=run.parse_time(START))
+    simulator.analog['D5'] = run.dark_hours(DARK)
+    server = standin.StandIn(simulator).start()
+    secrets = dict(run.SECRETS, time_api=server.url('time'), weather_api=server.url('weather'))
+    simulator.install()
+    sys.path[1:1] = [os.path.join(ROOT, 'lib'), os.path.dirname(script)]
+    preload_host_libraries(script)
+    baseline = set(sys.modules)
+    results = []
+    stdout = sys.stdout
+    try:
+        for wake in range(WAKES):
+            if wake:
+                simulator.new_wake()
+            simulator.wakes += 1
+            refreshes = len(simulator.panel.refreshes)
+            lit = simulator.analog_value('D5') != 0
+            if traced:
+                tracemalloc.start()
+            sys.stdout = open(os.devnull, 'w')
+            try:
+                with ImportTimer() as timer:
+                    run.run_wake(compiled, os.path.dirname(script), baseline, secrets)
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+            peak = retained = 0
+            if traced:
+                gc.collect()
+                retained, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            online = any(name in sys.modules for name in run.NETWORK_MODULES)
+            if lit:
+                label = 'fetch' if online else 'cached'
+            else:
+                label = 'dark, ' + ('clear' if len(simulator.panel.refreshes) > refreshes else 'blank')
+            if online and not lit:
+                label += ', online'
+            results.append((label, board_modules(timer.loaded, script), peak, retained))
+    finally:
+        sys.stdout = stdout
+        for name in list(sys.modules):
+            if name not in baseline:
+                del sys.modules[name]
+        simulator.uninstall()
+        server.stop()
+        del sys.path[1:3]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile code_7's imports and heap per wake path")
+    parser.add_argument('script', nargs='?', default=SCRIPT)
+    parser.add_argument('--top', type=int, default=12, help='slowest imports listed per wake')
+    args = parser.parse_args()
+    script = os.path.abspath(args.script)
+
+    # Bytecode of the libraries is written under the prefix by a first, unmeasured run
+    sys.pycache_prefix = tempfile.mkdtemp()
+    sys.dont_write_bytecode = False
+    compiled = py_compile.compile(script, cfile=os.path.join(sys.pycache_prefix, 'code.pyc'),
+                                  doraise=True)
+    run_wakes(script, compiled, False)
+    timed = run_wakes(script, compiled, False)
+    traced = run_wakes(script, compiled, True)
+    print('{:<16} {:>8} {:>10} {:>10} {:>10}'.format('wake path', 'modules', 'import ms', 'peak KB',
+                                                    'kept KB'))
+    for (label, loaded, _, _), (_, _, peak, retained) in zip(timed, traced):
+        total = sum(ms for _, ms, depth in loaded if depth == 0)
+        print('{:<16} {:>8d} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+            label, len(loaded), total, peak / 1024, retained / 1024))
+    for label, loaded, _, _ in timed:
+        print()
+        print('{}: {}'.format(label, ' '.join(sorted(name for name, _, _ in loaded)) or '-'))
+        for name, ms, depth in sorted(loaded, key=lambda e: -e[1])[:args.top]:
+            print('  {:<24} {:8.2f} ms{}'.format(name, ms, '' if depth == 0 else '  (nested)'))
+
+
+if __name__ == '__main__':
+    main()
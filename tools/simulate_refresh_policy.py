@@ -0,0 +1,116 @@
+# Host simulation of the refresh scheduler: runs a month of synthetic wakes of
+# the weather display (one every 30 minutes, panel cleared in the dark) through
+# refreshsched with a few policies and compares total refresh time, the number
+# of full refreshes and how much ghosting budget was in use while the panel was
+# on show.
+#
+#   python tools/simulate_refresh_policy.py [--days 30] [--seed 1]
+
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+import refreshsched
+from sleepstate import SleepState
+
+WAKE_INTERVAL = 30 * 60
+
+# Panel rectangles (inclusive) redrawn by buffer_screen, see code_7
+DATE = (0, 0, 415, 108)
+INDOOR = (440, 0, 799, 100)
+HOURLY = (144, 128, 711, 224)
+DAILY = (24, 256, 799, 469)
+PROGRESS = (48, 470, 111, 479)
+
+POLICIES = (
+    ("always full", refreshsched.RefreshPolicy(max_updates=0)),
+    ("full every 4", refreshsched.RefreshPolicy(max_updates=4, max_area=1000, max_age=1 << 30,
+                                                full_area=2, early_full_area=2)),
+    ("default", refreshsched.RefreshPolicy()),
+    ("relaxed", refreshsched.RefreshPolicy(max_updates=16, max_area=3, max_age=24 * 3600)),
+)
+
+
+def wakes(days, seed):
+    # Yields (time, changed rectangles) per wake; None means too dark and the
+    # panel is cleared. Rectangles stand in for EPD.diff_region
+    rng = random.Random(seed)
+    for i in range(days * 24 * 3600 // WAKE_INTERVAL):
+        now = i * WAKE_INTERVAL
+        hour = now // 3600 % 24
+        if hour >= 22 or hour < 6:
+            yield now, None
+            continue
+        changes = []
+        if now % 3600 in (0, 1800):
+            changes.append(PROGRESS)
+        if hour == 0 and now % 3600 == 0:
+            changes.append(DATE)
+        if rng.random() < 0.6:
+            changes.append(INDOOR)
+        if now % 3600 == 0 and rng.random() < 0.8:
+            changes.append(HOURLY)
+        if now % (3 * 3600) == 0 and rng.random() < 0.5:
+            changes.append(DAILY)
+        yield now, changes
+
+
+def simulate(policy, days, seed):
+    # The judge sees the same refreshes but keeps the default thresholds, so the
+    # budget figures compare across policies
+    scheduler = refreshsched.RefreshScheduler(policy, SleepState(bytearray(64)))
+    judge = refreshsched.RefreshScheduler()
+    counts = [0, 0, 0]
+    busy = 0.0
+    shown = 0
+    budget = 0.0
+    worst = 0.0
+    on_panel = False    # the last frame is still on the panel (not cleared)
+    for now, changes in wakes(days, seed):
+        if changes is None:
+            kind = refreshsched.FULL if on_panel else None
+            changed = 0
+            on_panel = False
+        elif on_panel:
+            changed = sum((r[2] - r[0] + 1) * (r[3] - r[1] + 1) for r in changes)
+            if not changed:
+                continue    # frame unchanged, the refresh is skipped
+            kind = scheduler.decide(changed, now)
+        else:
+            changed = refreshsched.PANEL_AREA
+            kind = scheduler.decide(changed, now, False, False)
+        if kind is None:
+            continue
+        scheduler.record(kind, changed, now)
+        judge.record(kind, changed, now)
+        counts[kind] += 1
+        busy += policy.cost(kind)
+        if changes is not None:
+            on_panel = True
+            used = judge.budget_used(now)
+            shown += 1
+            budget += used
+            worst = max(worst, used)
+    return counts, busy, budget / max(shown, 1), worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare refresh policies over synthetic wakes')
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    print('{} days, budget used as judged by the default policy (1.0 = exhausted)'.format(args.days))
+    print('{:14} {:>6} {:>8} {:>10} {:>12} {:>12}'.format(
+        'policy', 'full', 'partial', 'refresh s', 'mean budget', 'worst budget'))
+    for name, policy in POLICIES:
+        counts, busy, mean, worst = simulate(policy, args.days, args.seed)
+        print('{:14} {:6d} {:8d} {:10.0f} {:12.2f} {:12.2f}'.format(
+            name, counts[refreshsched.FULL], counts[refreshsched.PARTIAL], busy, mean, worst))
+
+
+if __name__ == '__main__':
+    main()